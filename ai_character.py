@@ -5,8 +5,14 @@ Handles interaction with OpenAI's API including vision capabilities.
 """
 
 import os
+import time
+import threading
 from typing import List, Dict, Optional
+import httpx
 from openai import OpenAI
+from rate_limiter import RateLimiter, PRIORITY_INTERACTIVE
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
 
 
 class AICharacter:
@@ -16,7 +22,11 @@ class AICharacter:
         self, 
         api_key: str,
         character_name: str = "Assistant",
-        personality: str = "friendly and helpful AI companion"
+        personality: str = "friendly and helpful AI companion",
+        max_history_messages: int = 20,
+        history_trim_chunk: int = 10,
+        rate_limiter: Optional[RateLimiter] = None,
+        base_url: Optional[str] = None
     ):
         """
         Initialize the AI character.
@@ -25,12 +35,47 @@ class AICharacter:
             api_key: OpenAI API key
             character_name: Name of the character
             personality: Personality description for the system prompt
+            max_history_messages: Messages kept after the system prompt
+            history_trim_chunk: Minimum number of old messages dropped at once
+                when the history is full (1 gives a sliding window)
+            rate_limiter: Optional scheduler shared with other characters
+                using the same API key
+            base_url: Optional OpenAI-compatible endpoint (e.g. a local server);
+                defaults to OPENAI_BASE_URL if that is set, else OpenAI
         """
-        self.client = OpenAI(api_key=api_key)
+        # An empty OPENAI_BASE_URL (as left by a blank .env entry) would
+        # otherwise become the client's base URL
+        base_url = base_url or os.environ.get('OPENAI_BASE_URL') or DEFAULT_BASE_URL
+        
+        # Keep idle connections pooled so later turns skip DNS, TCP and TLS setup
+        self.client = OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=httpx.Client(limits=httpx.Limits(keepalive_expiry=300))
+        )
         self.character_name = character_name
         self.personality = personality
+        self.max_history_messages = max_history_messages
+        self.history_trim_chunk = history_trim_chunk
+        self.rate_limiter = rate_limiter
         self.conversation_history: List[Dict] = []
         
+        # Token usage from the API, including prompt tokens served from cache
+        self.last_usage: Dict[str, int] = {}
+        self.usage_totals: Dict[str, int] = {"prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+        
+        # "length" when the last response was cut off by max_tokens
+        self.last_finish_reason: Optional[str] = None
+        
+        # Last request sent and time spent on it, for turn recording
+        self.last_request: Dict = {}
+        self.last_timings: Dict[str, float] = {}
+        
+        # Connection keepalive state (see start_keepalive)
+        self._last_network_time = 0.0
+        self._keepalive_thread: Optional[threading.Thread] = None
+        self._keepalive_stop = threading.Event()
+        
         # Initialize with system prompt
         self.system_prompt = (
             f"You are {character_name}, a {personality}. "
@@ -44,13 +89,21 @@ class AICharacter:
             "content": self.system_prompt
         })
     
-    def chat(self, user_message: str, screen_image_base64: Optional[str] = None) -> str:
+    def chat(
+        self,
+        user_message: str,
+        screen_image_base64: Optional[str] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+        max_tokens: int = 500
+    ) -> str:
         """
         Send a message to the AI character and get a response.
         
         Args:
             user_message: The user's text input
             screen_image_base64: Optional base64-encoded screenshot
+            priority: Scheduling priority when a rate limiter is used
+            max_tokens: Maximum length of the response
         
         Returns:
             AI character's response
@@ -76,17 +129,28 @@ class AICharacter:
             "content": message_content
         })
         
+        self.last_timings = {}
         try:
+            request = self._build_request(screen_image_base64 is not None, max_tokens)
+            self.last_request = dict(request, messages=list(request["messages"]))
+            estimated_tokens = self._estimate_tokens(request)
+            queued = 0.0
+            if self.rate_limiter:
+                queued = self.rate_limiter.acquire(request["model"], estimated_tokens, priority)
+            
             # Get response from OpenAI
-            response = self.client.chat.completions.create(
-                model="gpt-4o" if screen_image_base64 else "gpt-4o-mini",
-                messages=self.conversation_history,
-                max_tokens=500,
-                temperature=0.7
-            )
+            start = time.perf_counter()
+            response = self.client.chat.completions.create(**request)
+            self._last_network_time = time.monotonic()
+            self.last_timings = {"rate_limit_wait": queued, "api": time.perf_counter() - start}
+            self._record_usage(response)
+            if self.rate_limiter and self.last_usage:
+                actual_tokens = self.last_usage["prompt_tokens"] + self.last_usage["completion_tokens"]
+                self.rate_limiter.record_usage(request["model"], estimated_tokens, actual_tokens)
             
             # Extract the assistant's response
             assistant_message = response.choices[0].message.content
+            self.last_finish_reason = response.choices[0].finish_reason
             
             # Add assistant response to history
             self.conversation_history.append({
@@ -94,9 +158,7 @@ class AICharacter:
                 "content": assistant_message
             })
             
-            # Keep conversation history manageable (keep last 20 messages + system)
-            if len(self.conversation_history) > 21:
-                self.conversation_history = [self.conversation_history[0]] + self.conversation_history[-20:]
+            self._trim_history()
             
             return assistant_message
         
@@ -105,6 +167,123 @@ class AICharacter:
             print(error_msg)
             return f"Sorry, I'm having trouble responding right now. Error: {str(e)}"
     
+    def _build_request(self, has_image: bool, max_tokens: int = 500) -> Dict:
+        """
+        Build the chat completion request.
+        
+        The system prompt and history are sent unchanged from turn to turn so
+        the request starts with the same bytes as the previous one, letting
+        the API reuse its cached processing of that prefix.
+        """
+        return {
+            "model": "gpt-4o" if has_image else "gpt-4o-mini",
+            "messages": self.conversation_history,
+            "max_tokens": max_tokens,
+            "temperature": 0.7
+        }
+    
+    @staticmethod
+    def _estimate_tokens(request: Dict) -> int:
+        """Rough token count for a request, as charged against rate limits."""
+        tokens = request["max_tokens"]
+        for message in request["messages"]:
+            content = message["content"]
+            if isinstance(content, str):
+                tokens += len(content) // 4 + 4
+                continue
+            for part in content:
+                if part["type"] == "text":
+                    tokens += len(part["text"]) // 4
+                else:
+                    # A 1024x768 image costs about this much at high detail
+                    tokens += 765
+        return tokens
+    
+    def _trim_history(self):
+        """
+        Keep conversation history manageable.
+        
+        Old messages are dropped in chunks of at least `history_trim_chunk`
+        rather than one turn at a time, so the prompt prefix only changes
+        every few turns instead of on every turn once the history is full.
+        """
+        history = self.conversation_history[1:]
+        excess = len(history) - self.max_history_messages
+        if excess <= 0:
+            return
+        
+        drop = max(excess, self.history_trim_chunk)
+        # Start the kept history on a user message
+        while drop < len(history) and history[drop]["role"] != "user":
+            drop += 1
+        self.conversation_history = [self.conversation_history[0]] + history[drop:]
+    
+    def _record_usage(self, response):
+        """Record token usage, including cached prompt tokens, from a response."""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.last_usage = {
+            "prompt_tokens": usage.prompt_tokens or 0,
+            "cached_tokens": (getattr(details, "cached_tokens", 0) or 0) if details else 0,
+            "completion_tokens": usage.completion_tokens or 0
+        }
+        for key, value in self.last_usage.items():
+            self.usage_totals[key] += value
+    
+    def warm_up(self) -> Optional[float]:
+        """
+        Open a pooled connection to the API with a cheap request.
+        
+        Returns:
+            Seconds the request took, or None if it failed
+        """
+        start = time.perf_counter()
+        try:
+            self.client.models.list()
+        except Exception as e:
+            print(f"Error warming up AI connection: {e}")
+            return None
+        self._last_network_time = time.monotonic()
+        return time.perf_counter() - start
+    
+    def start_keepalive(self, interval: float = 30.0):
+        """
+        Warm up the connection now and keep it open while idle.
+        
+        A background thread re-sends the warm-up request whenever no API call
+        has been made for `interval` seconds, so the server doesn't close the
+        pooled connection between turns.
+        
+        Args:
+            interval: Idle seconds between keepalive requests
+        """
+        if self._keepalive_thread is not None:
+            return
+        self._keepalive_stop.clear()
+        self._keepalive_thread = threading.Thread(target=self._keepalive_loop, args=(interval,))
+        self._keepalive_thread.daemon = True
+        self._keepalive_thread.start()
+    
+    def stop_keepalive(self):
+        """Stop the keepalive thread."""
+        if self._keepalive_thread is None:
+            return
+        self._keepalive_stop.set()
+        self._keepalive_thread.join(timeout=2)
+        self._keepalive_thread = None
+    
+    def _keepalive_loop(self, interval: float):
+        """Internal method that pings the API while the conversation is idle."""
+        self.warm_up()
+        while not self._keepalive_stop.is_set():
+            idle = time.monotonic() - self._last_network_time
+            if idle >= interval:
+                self.warm_up()
+                idle = 0.0
+            self._keepalive_stop.wait(interval - idle)
+    
     def reset_conversation(self):
         """Reset the conversation history."""
         self.conversation_history = [{
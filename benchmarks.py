@@ -0,0 +1,628 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for CommentBot components.
+Measures the latency of individual pipeline stages without needing an API key.
+"""
+
+import os
+import json
+import time
+import random
+import threading
+import statistics
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Optional
+import speech_recognition as sr
+from dotenv import load_dotenv
+from PIL import Image, ImageDraw
+
+from screen_capture import ScreenCapture
+
+
+def _report(name: str, samples: list):
+    """Print summary statistics for a list of timings in seconds."""
+    print(f"{name}: mean {statistics.mean(samples) * 1000:.1f}ms, "
+          f"min {min(samples) * 1000:.1f}ms, max {max(samples) * 1000:.1f}ms")
+
+
+def _synthetic_frame(size: tuple = (1920, 1080)) -> Image.Image:
+    """Draw a desktop-like frame: title bar, sidebar and an editor full of text."""
+    rng = random.Random(0)
+    img = Image.new("RGB", size, (30, 30, 30))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([0, 0, size[0], 32], fill=(60, 60, 60))
+    draw.rectangle([0, 32, 300, size[1]], fill=(45, 45, 48))
+    words = ["def", "return", "self", "screen", "capture", "import", "for", "in", "if", "None", "print", "value"]
+    for y in range(44, size[1], 18):
+        draw.text((12, y), rng.choice(words) + ".py", fill=(200, 200, 200))
+        line = " ".join(rng.choice(words) for _ in range(rng.randint(2, 12)))
+        color = rng.choice([(220, 220, 170), (86, 156, 214), (206, 145, 120), (212, 212, 212)])
+        draw.text((320 + rng.randint(0, 6) * 32, y), line, fill=color)
+    return img
+
+
+class SyntheticScreenCapture(ScreenCapture):
+    """ScreenCapture that returns a generated 1920x1080 frame, for machines without a display."""
+    
+    def __init__(self):
+        """Initialize without opening a display."""
+        self._owner_thread = threading.current_thread()
+        self._local = threading.local()
+        self._executor = None
+        self._last_frame = None
+        self._frame = _synthetic_frame()
+    
+    def capture_screen(self, monitor_number: int = 1) -> Optional[Image.Image]:
+        """Return a fresh copy of the synthetic frame, like a new grab would."""
+        self._last_frame = self._frame.copy()
+        return self._last_frame
+    
+    def get_monitor_count(self) -> int:
+        """Get the number of available monitors."""
+        return 1
+
+
+def _screen_capture_class() -> type:
+    """ScreenCapture, or SyntheticScreenCapture if there is no display to grab."""
+    try:
+        if ScreenCapture().capture_screen() is not None:
+            return ScreenCapture
+    except Exception:
+        pass
+    print("No display to capture; using a synthetic 1920x1080 screen\n")
+    return SyntheticScreenCapture
+
+
+def benchmark_pipelined_capture(turns: int = 5, recognition_seconds: float = 0.8):
+    """
+    Benchmark: screen-share turn latency with sequential vs pipelined capture.
+    
+    Speech recognition is simulated with a sleep so only the screen capture
+    and encoding cost is measured. Background work is the capture time spent
+    on every utterance, including the ones that turn out not to be screen shares.
+    """
+    print("=== Benchmark: Pipelined Screen Capture ===\n")
+    
+    screen = _screen_capture_class()()
+    
+    sequential = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        time.sleep(recognition_seconds)
+        screen.capture_as_base64()
+        sequential.append(time.perf_counter() - start)
+    _report("Sequential (recognize, then capture)", sequential)
+    
+    for label, start_capture in [("Pipelined grab", screen.grab_async), ("Pipelined grab and encode", screen.capture_async)]:
+        pipelined = []
+        saved = []
+        background = []
+        for _ in range(turns):
+            start = time.perf_counter()
+            pending = start_capture()
+            time.sleep(recognition_seconds)
+            pending.result()
+            pipelined.append(time.perf_counter() - start)
+            saved.append(pending.seconds_saved)
+            background.append(pending.capture_seconds)
+        _report(f"{label} (during recognition)", pipelined)
+        _report("  Latency saved per turn", saved)
+        _report("  Background work per utterance", background)
+
+
+def benchmark_tts_backends(text: Optional[str] = None):
+    """
+    Benchmark: time to first audio sample and real-time factor per TTS backend.
+    
+    Real-time factor is synthesis time divided by the length of the audio
+    produced; below 1.0 means the backend is faster than real time.
+    """
+    print("=== Benchmark: TTS Backends ===\n")
+    
+    from voice_output import create_backend
+    
+    text = text or (
+        "Hello there! I can see you're working on some Python code. "
+        "That function looks like it could use a docstring, but otherwise it's looking great."
+    )
+    
+    backends = [
+        ('null', 'null', {}),
+        ('pyttsx3', 'pyttsx3', {}),
+        ('pyttsx3 (render to file)', 'pyttsx3', {'render_to_file': True})
+    ]
+    if os.getenv('PIPER_MODEL'):
+        backends.append(('piper', 'piper', {'model_path': os.getenv('PIPER_MODEL')}))
+    
+    for label, name, options in backends:
+        try:
+            backend = create_backend(name, **options)
+            if backend.plays_audio:
+                # Speaks through the system, so only the timings are known
+                first_audio, audio_seconds = backend.speak(text)
+                print(f"{label}: first audio {first_audio * 1000:.1f}ms, {audio_seconds:.2f}s of speech")
+                continue
+            start = time.perf_counter()
+            first_audio = None
+            frames = 0
+            for chunk in backend.synthesize(text):
+                if first_audio is None:
+                    first_audio = time.perf_counter() - start
+                frames += len(chunk) // (backend.sample_width * backend.channels)
+            elapsed = time.perf_counter() - start
+        except Exception as e:
+            print(f"{label}: unavailable ({e})")
+            continue
+        
+        audio_seconds = frames / backend.sample_rate
+        rtf = elapsed / audio_seconds if audio_seconds else float('inf')
+        print(f"{label}: first audio {(first_audio or 0) * 1000:.1f}ms, "
+              f"{audio_seconds:.2f}s of audio, real-time factor {rtf:.3f}")
+
+
+class MockPrefixCacheClient:
+    """
+    Stands in for the OpenAI client and models prompt prefix caching.
+    
+    Like the real API, a prompt's longest byte-identical prefix shared with an
+    earlier prompt is served from cache in 128-token blocks once it reaches
+    1024 tokens; only the remaining tokens cost processing time.
+    """
+    
+    def __init__(self, seconds_per_token: float = 0.0002, reply_words: int = 60):
+        """
+        Initialize the mock client.
+        
+        Args:
+            seconds_per_token: Simulated processing time per uncached prompt token
+            reply_words: Length of each canned reply
+        """
+        self.seconds_per_token = seconds_per_token
+        self.reply_words = reply_words
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self._prompts = []
+        self.processing_seconds = []
+    
+    def _create(self, messages, **kwargs):
+        """Return a canned completion and record simulated prompt processing time."""
+        prompt = json.dumps(messages)
+        shared = max((len(os.path.commonprefix([prompt, old])) for old in self._prompts), default=0)
+        self._prompts.append(prompt)
+        
+        # Roughly four characters per token
+        prompt_tokens = len(prompt) // 4
+        cached_tokens = shared // 4 // 128 * 128
+        if cached_tokens < 1024:
+            cached_tokens = 0
+        self.processing_seconds.append((prompt_tokens - cached_tokens) * self.seconds_per_token)
+        
+        reply = " ".join(f"word{i}" for i in range(len(self._prompts), len(self._prompts) + self.reply_words))
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=reply), finish_reason="stop")],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=self.reply_words,
+                prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens)
+            )
+        )
+
+
+def benchmark_prompt_caching(turns: int = 60):
+    """
+    Benchmark: prompt processing latency on a long mock conversation.
+    
+    Compares trimming one turn at a time (sliding window) with trimming the
+    history in chunks, which keeps the prompt prefix stable for several turns.
+    """
+    print("=== Benchmark: Prompt Prefix Caching ===\n")
+    
+    from ai_character import AICharacter
+    
+    for label, trim_chunk in [("Sliding window", 1), ("Chunked trimming", 10)]:
+        ai = AICharacter(api_key="mock", history_trim_chunk=trim_chunk)
+        ai.client = MockPrefixCacheClient()
+        for turn in range(turns):
+            ai.chat(f"This is message number {turn}. " + "Tell me more about that. " * 10)
+        
+        totals = ai.usage_totals
+        hit_rate = totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0
+        _report(f"{label} prompt processing", ai.client.processing_seconds)
+        print(f"{label}: {hit_rate:.0%} of prompt tokens served from cache\n")
+
+
+class MockQuotaServer:
+    """
+    Local stand-in for the chat completions endpoint that enforces a quota.
+    
+    Like the real API, the per-minute limits are enforced over short fixed
+    windows (e.g. 1200 requests per minute as 20 per second). Requests over
+    the window's request or token budget get a 429.
+    """
+    
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, window_seconds: float = 1.0):
+        """
+        Start the server on a free local port.
+        
+        Args:
+            requests_per_minute: Request budget
+            tokens_per_minute: Token budget (prompt estimate + max_tokens)
+            window_seconds: Length of the fixed windows the budget is counted in
+        """
+        self.window_seconds = window_seconds
+        self.window_requests = requests_per_minute * window_seconds / 60.0
+        self.window_tokens = tokens_per_minute * window_seconds / 60.0
+        self.accepted = 0
+        self.rejected = 0
+        self._window = None
+        self._used = [0, 0]
+        self._lock = threading.Lock()
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                tokens = len(body) // 4 + json.loads(body)["max_tokens"]
+                allowed = server._admit(tokens)
+                self.send_response(200 if allowed else 429)
+                self.end_headers()
+                self.wfile.write(b'{}')
+            
+            def log_message(self, *args):
+                pass
+        
+        class Server(ThreadingHTTPServer):
+            # Room for every simulated client to connect at once
+            request_queue_size = 256
+        
+        self.httpd = Server(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1/chat/completions"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+    
+    def _admit(self, tokens: int) -> bool:
+        """Count a request against the current window and decide whether it is allowed."""
+        with self._lock:
+            window = int(time.time() // self.window_seconds)
+            if window != self._window:
+                self._window = window
+                self._used = [0, 0]
+            allowed = (self._used[0] + 1 <= self.window_requests
+                       and self._used[1] + tokens <= self.window_tokens)
+            if allowed:
+                self._used[0] += 1
+                self._used[1] += tokens
+                self.accepted += 1
+            else:
+                self.rejected += 1
+            return allowed
+    
+    def close(self):
+        """Stop the server."""
+        self.httpd.shutdown()
+
+
+def run_quota_clients(url: str, limiter, clients: int, requests_per_client: int) -> dict:
+    """
+    Fire bursts of requests from many simulated bots at a quota server.
+    
+    Even-numbered clients are interactive voice turns, odd ones background
+    commentary.
+    
+    Args:
+        url: Chat completions URL of the server
+        limiter: RateLimiter the clients schedule through, or None
+        clients: Number of simulated bots
+        requests_per_client: Requests each bot sends
+    
+    Returns:
+        Queueing delays in seconds, keyed by priority
+    """
+    from rate_limiter import PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+    
+    delays = {PRIORITY_INTERACTIVE: [], PRIORITY_BACKGROUND: []}
+    delays_lock = threading.Lock()
+    
+    def client(index):
+        priority = PRIORITY_INTERACTIVE if index % 2 == 0 else PRIORITY_BACKGROUND
+        rng = random.Random(index)
+        for _ in range(requests_per_client):
+            body = json.dumps({
+                "model": "mock",
+                "messages": [{"role": "user", "content": "x" * rng.randint(100, 600)}],
+                "max_tokens": 100
+            }).encode()
+            if limiter is not None:
+                waited = limiter.acquire("mock", len(body) // 4 + 100, priority)
+                with delays_lock:
+                    delays[priority].append(waited)
+            request = urllib.request.Request(url, data=body, method="POST")
+            try:
+                urllib.request.urlopen(request).read()
+            except urllib.error.HTTPError:
+                pass
+    
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return delays
+
+
+def benchmark_rate_limiter(clients: int = 40, requests_per_client: int = 5):
+    """
+    Benchmark: many bots sharing one API quota, with and without the rate limiter.
+    
+    Half of the simulated clients are interactive voice turns and half are
+    background commentary; each fires its requests in bursts.
+    """
+    print("=== Benchmark: Shared API Quota ===\n")
+    
+    from rate_limiter import RateLimiter, settings_from_env, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+    
+    requests_per_minute, tokens_per_minute = 1200, 200000
+    
+    for use_limiter in (False, True):
+        server = MockQuotaServer(requests_per_minute, tokens_per_minute)
+        limiter = None
+        if use_limiter:
+            # Configured the way CommentBot configures it from the environment
+            limiter = RateLimiter(**settings_from_env({"RATE_LIMITS": f"mock:{requests_per_minute}:{tokens_per_minute}"}))
+        
+        start = time.perf_counter()
+        delays = run_quota_clients(server.url, limiter, clients, requests_per_client)
+        elapsed = time.perf_counter() - start
+        server.close()
+        
+        label = "With rate limiter" if use_limiter else "Without rate limiter"
+        print(f"{label}: {server.accepted} accepted, {server.rejected} rejected with 429 in {elapsed:.1f}s")
+        if use_limiter:
+            _report("  Interactive queueing delay", delays[PRIORITY_INTERACTIVE])
+            _report("  Background queueing delay", delays[PRIORITY_BACKGROUND])
+        print()
+
+
+def _audio_jitter(stop: threading.Event, period: float = 1024 / 44100) -> list:
+    """
+    Simulate an audio thread that must wake once per buffer period.
+    
+    Returns:
+        How late each wake-up was, in seconds
+    """
+    lateness = []
+    deadline = time.perf_counter() + period
+    while not stop.is_set():
+        time.sleep(max(0.0, deadline - time.perf_counter()))
+        now = time.perf_counter()
+        lateness.append(now - deadline)
+        deadline = max(deadline + period, now)
+    return lateness
+
+
+class OfflineGoogleRecognizer(sr.Recognizer):
+    """
+    Recognizer that does the local part of `recognize_google` (converting the
+    audio to FLAC) and then waits out a simulated network round trip.
+    """
+    
+    network_seconds = 0.3
+    
+    def recognize_google(self, audio_data, *args, **kwargs) -> str:
+        """Convert the audio like Google recognition does and return a fixed transcript."""
+        audio_data.get_flac_data(convert_rate=None if audio_data.sample_rate >= 8000 else 8000, convert_width=2)
+        time.sleep(self.network_seconds)
+        return "what do you see on my screen"
+
+
+def benchmark_worker_isolation(seconds: float = 5.0, turns: int = 5):
+    """
+    Benchmark: audio thread jitter and screen-share turn latency, with and
+    without worker processes.
+    
+    The screen is captured continuously in the background while simulated
+    turns recognize an utterance and then capture the screen. Google
+    recognition's network round trip is simulated, so no API access is needed.
+    """
+    print("=== Benchmark: Worker Process Isolation ===\n")
+    
+    import numpy as np
+    from workers import IsolatedScreenCapture, RecognizerWorker
+    
+    screen_class = _screen_capture_class()
+    # Three seconds of a 16 kHz tone stands in for an utterance
+    samples = np.sin(np.arange(3 * 16000) * 2 * np.pi * 440 / 16000) * 3000
+    audio = sr.AudioData(samples.astype(np.int16).tobytes(), 16000, 2)
+    
+    for isolated in (False, True):
+        if isolated:
+            background = IsolatedScreenCapture(screen_class=screen_class)
+            screen = IsolatedScreenCapture(screen_class=screen_class)
+            recognizer = RecognizerWorker(recognizer_class=OfflineGoogleRecognizer)
+            recognize = recognizer.recognize
+        else:
+            background = screen_class()
+            screen = screen_class()
+            recognize = OfflineGoogleRecognizer().recognize_google
+        # Leave worker start-up and first-use imports out of the timings
+        recognize(audio)
+        screen.capture_as_base64()
+        background.capture_as_base64()
+        stop = threading.Event()
+        
+        def capture_loop():
+            # Continuous screen capture competing with the audio thread
+            while not stop.is_set():
+                background.capture_as_base64()
+        
+        capture_thread = threading.Thread(target=capture_loop, daemon=True)
+        capture_thread.start()
+        
+        jitter = []
+        audio_thread = threading.Thread(target=lambda: jitter.extend(_audio_jitter(stop)), daemon=True)
+        audio_thread.start()
+        
+        recognize_latency = []
+        capture_latency = []
+        turn_latency = []
+        end = time.perf_counter() + seconds
+        for _ in range(turns):
+            start = time.perf_counter()
+            recognize(audio)
+            recognized = time.perf_counter()
+            screen.capture_as_base64()
+            done = time.perf_counter()
+            recognize_latency.append(recognized - start)
+            capture_latency.append(done - recognized)
+            turn_latency.append(done - start)
+        time.sleep(max(0.0, end - time.perf_counter()))
+        
+        stop.set()
+        audio_thread.join()
+        capture_thread.join()
+        if isolated:
+            background.close()
+            screen.close()
+            recognizer.close()
+        
+        label = "Isolated" if isolated else "In-process"
+        jitter.sort()
+        print(f"{label}: audio jitter p50 {jitter[len(jitter) // 2] * 1000:.2f}ms, "
+              f"p99 {jitter[int(len(jitter) * 0.99)] * 1000:.2f}ms, max {jitter[-1] * 1000:.2f}ms")
+        _report(f"{label}: recognition", recognize_latency)
+        _report(f"{label}: screen capture", capture_latency)
+        _report(f"{label}: screen-share turn", turn_latency)
+        print()
+
+
+class SlowConnectServer:
+    """
+    Local OpenAI-compatible stub that charges a delay for every new connection.
+    
+    The delay stands in for the DNS, TCP and TLS setup of a real endpoint;
+    requests on an already open keep-alive connection are answered at once.
+    """
+    
+    def __init__(self, connect_delay: float = 0.3):
+        """
+        Start the server on a free local port.
+        
+        Args:
+            connect_delay: Seconds added to the first request on each connection
+        """
+        self.connections = 0
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def setup(self):
+                server.connections += 1
+                time.sleep(connect_delay)
+                super().setup()
+            
+            def _reply(self, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def do_GET(self):
+                self._reply({"object": "list", "data": [{"id": "mock", "object": "model", "created": 0, "owned_by": "mock"}]})
+            
+            def do_POST(self):
+                self.rfile.read(int(self.headers['Content-Length']))
+                self._reply({
+                    "id": "mock", "object": "chat.completion", "created": 0, "model": "mock",
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": "Hi!"}}],
+                    "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12}
+                })
+            
+            def log_message(self, *args):
+                pass
+        
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+    
+    def close(self):
+        """Stop the server."""
+        self.httpd.shutdown()
+
+
+def benchmark_connection_warmup(idle_seconds: float = 8.0, connect_delay: float = 0.3):
+    """
+    Benchmark: first-turn and post-idle latency with and without connection warm-up.
+    
+    The stub server closes nothing itself, so idle connections are dropped by
+    giving the client a short pool expiry, like a server-side idle timeout would.
+    """
+    print("=== Benchmark: Connection Warm-up ===\n")
+    
+    import httpx
+    from ai_character import AICharacter
+    
+    server = SlowConnectServer(connect_delay)
+    for warm in (False, True):
+        ai = AICharacter(api_key="mock", base_url=server.base_url)
+        ai.client = ai.client.with_options(
+            http_client=httpx.Client(limits=httpx.Limits(keepalive_expiry=idle_seconds / 2))
+        )
+        if warm:
+            ai.start_keepalive(interval=idle_seconds / 4)
+            time.sleep(0.5 + connect_delay)
+        
+        start = time.perf_counter()
+        ai.chat("Hello!")
+        first_turn = time.perf_counter() - start
+        
+        time.sleep(idle_seconds)
+        start = time.perf_counter()
+        ai.chat("Still there?")
+        post_idle = time.perf_counter() - start
+        ai.stop_keepalive()
+        
+        label = "With warm-up" if warm else "Without warm-up"
+        print(f"{label}: first turn {first_turn * 1000:.1f}ms, after {idle_seconds:.0f}s idle {post_idle * 1000:.1f}ms")
+    server.close()
+    print(f"\n(each new connection costs {connect_delay * 1000:.0f}ms)")
+
+
+def main():
+    """Run benchmarks."""
+    load_dotenv()
+    print("CommentBot Benchmarks\n")
+    print("Choose a benchmark to run:")
+    print("1. Pipelined Screen Capture")
+    print("2. TTS Backends")
+    print("3. Prompt Prefix Caching")
+    print("4. Shared API Quota")
+    print("5. Worker Process Isolation")
+    print("6. Connection Warm-up")
+    print("0. Exit")
+    
+    choice = input("\nEnter choice (0-6): ").strip()
+    
+    benchmarks = {
+        '1': benchmark_pipelined_capture,
+        '2': benchmark_tts_backends,
+        '3': benchmark_prompt_caching,
+        '4': benchmark_rate_limiter,
+        '5': benchmark_worker_isolation,
+        '6': benchmark_connection_warmup
+    }
+    
+    if choice in benchmarks:
+        benchmarks[choice]()
+    elif choice == '0':
+        print("Goodbye!")
+    else:
+        print("Invalid choice")
+
+
+if __name__ == "__main__":
+    main()
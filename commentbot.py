@@ -6,12 +6,16 @@ Main application that integrates all components.
 
 import os
 import sys
+import threading
 from dotenv import load_dotenv
 
 from screen_capture import ScreenCapture
 from voice_input import VoiceInput
-from voice_output import VoiceOutput
+from voice_output import VoiceOutput, SpeakingBudget, create_backend
 from ai_character import AICharacter
+from rate_limiter import get_rate_limiter, settings_from_env
+from workers import IsolatedScreenCapture, RecognizerWorker
+from turn_recorder import TurnRecord, TurnRecorder
 
 
 class CommentBot:
@@ -35,18 +39,69 @@ class CommentBot:
         # Voice settings
         voice_rate = int(os.getenv('VOICE_RATE', '150'))
         voice_volume = float(os.getenv('VOICE_VOLUME', '0.9'))
+        speaking_time_budget = float(os.getenv('SPEAKING_TIME_BUDGET', '0'))
+        tts_backend = os.getenv('TTS_BACKEND', 'pyttsx3')
+        tts_options = {}
+        if tts_backend == 'pyttsx3':
+            tts_options['render_to_file'] = os.getenv('PYTTSX3_RENDER_TO_FILE', 'false').lower() == 'true'
+        if tts_backend == 'piper':
+            tts_options['model_path'] = os.getenv('PIPER_MODEL', '')
+            tts_options['executable'] = os.getenv('PIPER_EXECUTABLE', 'piper')
+        
+        # Keep the microphone open between turns so no speech is lost
+        self.continuous_capture = os.getenv('CONTINUOUS_CAPTURE', 'false').lower() == 'true'
+        
+        # Capture the screen as soon as speech starts, overlapping recognition
+        self.pipelined_screen_capture = os.getenv('PIPELINED_SCREEN_CAPTURE', 'false').lower() == 'true'
+        # Only grab the frame in the background and encode it once a share is asked for
+        self.pipelined_grab_only = os.getenv('PIPELINED_GRAB_ONLY', 'false').lower() == 'true'
+        self._pending_capture = None
+        
+        # Run screen encoding and speech recognition in worker processes
+        self.isolate_workers = os.getenv('ISOLATE_WORKERS', 'false').lower() == 'true'
+        
+        # Save each turn to disk so slow turns can be replayed
+        record_dir = os.getenv('RECORD_TURNS_DIR')
+        self.turn_recorder = TurnRecorder(record_dir) if record_dir else None
+        self._turn_record = None
+        
+        # API quota shared by every bot using this key, only when configured
+        rate_limit_settings = settings_from_env()
+        rate_limiter = get_rate_limiter(**rate_limit_settings) if rate_limit_settings else None
         
         # Initialize components
         print("Initializing CommentBot...")
-        self.screen_capture = ScreenCapture()
+        self.screen_capture = IsolatedScreenCapture() if self.isolate_workers else ScreenCapture()
         self.voice_input = VoiceInput()
-        self.voice_output = VoiceOutput(rate=voice_rate, volume=voice_volume)
+        if self.isolate_workers:
+            self.voice_input.recognizer_worker = RecognizerWorker()
+        if self.continuous_capture:
+            self.voice_input.start_capture()
+        if self.pipelined_screen_capture:
+            self.voice_input.speech_start_callback = self._prefetch_screen
+        self.voice_output = VoiceOutput(
+            backend=create_backend(tts_backend, rate=voice_rate, volume=voice_volume, **tts_options)
+        )
+        
+        # Keep answers short enough to speak within the budget
+        self.speaking_budget = None
+        self.pending_continuation = ""
+        if speaking_time_budget > 0:
+            self.speaking_budget = SpeakingBudget(max_seconds=speaking_time_budget, rate=voice_rate)
+            self.voice_output.speech_finished_callback = self.speaking_budget.record
         self.ai_character = AICharacter(
             api_key=self.api_key,
             character_name=self.character_name,
-            personality=self.personality
+            personality=self.personality,
+            rate_limiter=rate_limiter,
+            base_url=os.getenv('OPENAI_BASE_URL') or None
         )
         
+        # Connect to the API now rather than during the first turn
+        keepalive_seconds = float(os.getenv('API_KEEPALIVE_SECONDS', '30'))
+        if keepalive_seconds > 0:
+            self.ai_character.start_keepalive(keepalive_seconds)
+        
         print(f"\n{self.character_name} is ready!")
         print(f"Detected {self.screen_capture.get_monitor_count()} monitor(s)")
         print("\nCommands:")
@@ -56,6 +111,17 @@ class CommentBot:
         print("  - Say 'reset' to start a new conversation")
         print("\nListening...\n")
     
+    def _prefetch_screen(self):
+        """Start capturing the screen in the background when speech begins."""
+        if self._pending_capture is not None:
+            self._pending_capture.cancel()
+        if self.pipelined_grab_only and not self.isolate_workers:
+            # Skip the encode on utterances that turn out not to be screen
+            # shares, at the cost of encoding after recognition on those that are
+            self._pending_capture = self.screen_capture.grab_async()
+        else:
+            self._pending_capture = self.screen_capture.capture_async()
+    
     def process_user_input(self, user_text: str):
         """
         Process user input and generate AI response.
@@ -71,14 +137,23 @@ class CommentBot:
         if user_text_lower in ['exit', 'quit', 'goodbye', 'bye']:
             response = "Goodbye! It was nice talking to you!"
             print(f"{self.character_name}: {response}")
-            self.voice_output.speak(response, blocking=True)
+            self._speak(response, blocking=True)
             return False  # Signal to exit
         
         if user_text_lower in ['reset', 'new conversation', 'start over']:
             self.ai_character.reset_conversation()
             response = "Okay, let's start a fresh conversation!"
             print(f"{self.character_name}: {response}")
-            self.voice_output.speak(response, blocking=True)
+            self._speak(response, blocking=True)
+            return True
+        
+        # Finish an answer that was cut short to fit the speaking-time budget
+        continuation, self.pending_continuation = self.pending_continuation, ""
+        if continuation and user_text_lower in ['continue', 'go on', 'keep going', 'yes', 'yes please']:
+            if self._pending_capture is not None:
+                self._pending_capture.cancel()
+                self._pending_capture = None
+            self._speak_response(continuation)
             return True
         
         # Check if user wants to share screen
@@ -87,21 +162,94 @@ class CommentBot:
             'what do you see', 'look at this', 'check my screen'
         ])
         
+        record = self._turn_record or TurnRecord()
+        
         # Get AI response
         screen_data = None
-        if share_screen:
-            print("Capturing screen...")
-            screen_data = self.screen_capture.capture_as_base64()
-            if screen_data:
-                print("Screen shared with AI")
+        pending_capture, self._pending_capture = self._pending_capture, None
+        with record.stage("screen"):
+            if share_screen and pending_capture is not None:
+                screen_data = pending_capture.result()
+                if screen_data:
+                    print(f"Screen shared with AI (captured in parallel, saved {pending_capture.seconds_saved:.2f}s)")
+            elif share_screen:
+                print("Capturing screen...")
+                screen_data = self.screen_capture.capture_as_base64()
+                if screen_data:
+                    print("Screen shared with AI")
+            elif pending_capture is not None:
+                pending_capture.cancel()
+        frame_copy = None
+        if screen_data and self._turn_record is not None:
+            # Keep the full-resolution frame so replays time the real resize and
+            # encode; copying it out of a worker takes a while, so do it while
+            # the API call is in flight
+            frame_copy = threading.Thread(target=self._record_screen_frame, args=(record,))
+            frame_copy.start()
         
-        response = self.ai_character.chat(user_text, screen_data)
+        with record.stage("chat"):
+            if self.speaking_budget:
+                response = self.ai_character.chat(user_text, screen_data, max_tokens=self.speaking_budget.max_tokens)
+                if self.ai_character.last_finish_reason == "length":
+                    response = self.speaking_budget.complete_sentences(response)
+            else:
+                response = self.ai_character.chat(user_text, screen_data)
+        if frame_copy is not None:
+            frame_copy.join()
         
-        print(f"{self.character_name}: {response}")
-        self.voice_output.speak(response)
+        record.screen_base64 = screen_data
+        record.request = self.ai_character.last_request
+        record.response = response
+        record.timings.update(self.ai_character.last_timings)
+        
+        self._speak_response(response)
         
         return True  # Continue conversation
     
+    def _speak_response(self, response: str):
+        """Speak a response, holding back whatever doesn't fit the speaking-time budget."""
+        if self.speaking_budget:
+            response, self.pending_continuation = self.speaking_budget.split(response)
+            if self.pending_continuation:
+                response += " Want me to continue?"
+        
+        print(f"{self.character_name}: {response}")
+        self._speak(response)
+    
+    def _speak(self, text: str, blocking: bool = False):
+        """Speak text, completing the turn being recorded once it has been spoken."""
+        record, self._turn_record = self._turn_record, None
+        callback = self._make_record_callback(record) if record is not None else None
+        self.voice_output.speak(text, blocking=blocking, callback=callback)
+    
+    def _make_record_callback(self, record: TurnRecord):
+        """Build a speech callback that adds the TTS timings to a record and saves it."""
+        def save_record(first_audio: float, audio_seconds: float):
+            record.timings["tts_first_audio"] = first_audio
+            record.timings["tts_audio"] = audio_seconds
+            self.turn_recorder.save(record)
+        return save_record
+    
+    def _record_screen_frame(self, record: TurnRecord):
+        """Store the full-resolution frame behind the shared screenshot in a record."""
+        record.screen_frame = self.screen_capture.get_last_frame()
+    
+    def _start_recorded_turn(self, user_text: str):
+        """Begin recording a turn, saving the previous one first."""
+        self._finish_recorded_turn()
+        record = TurnRecord()
+        record.transcript = user_text
+        record.timings["recognize"] = self.voice_input.last_recognition_seconds
+        if self.voice_input.last_audio is not None:
+            record.audio_wav = self.voice_input.last_audio.get_wav_data()
+        self._turn_record = record
+    
+    def _finish_recorded_turn(self):
+        """Save a turn that ended without speaking, e.g. because of an error."""
+        record, self._turn_record = self._turn_record, None
+        if record is not None:
+            self.turn_recorder.save(record)
+    
     def run(self):
         """Run the main application loop."""
         try:
@@ -110,6 +258,8 @@ class CommentBot:
                 user_text = self.voice_input.listen(timeout=30)
                 
                 if user_text:
+                    if self.turn_recorder:
+                        self._start_recorded_turn(user_text)
                     should_continue = self.process_user_input(user_text)
                     if not should_continue:
                         break
@@ -123,6 +273,14 @@ class CommentBot:
         except Exception as e:
             print(f"\nError: {e}")
             self.voice_output.speak("Sorry, I encountered an error.", blocking=True)
+        finally:
+            if self.turn_recorder:
+                self._finish_recorded_turn()
+            self.voice_input.stop_capture()
+            self.ai_character.stop_keepalive()
+            if self.isolate_workers:
+                self.screen_capture.close()
+                self.voice_input.recognizer_worker.close()
 
 
 def main():
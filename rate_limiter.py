@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Rate limiter module for the AI Character Bot.
+Schedules OpenAI API calls so several bots sharing one API key stay within
+the account's request and token quotas instead of hitting 429 errors.
+"""
+
+import os
+import json
+import time
+import heapq
+import itertools
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+# Lower numbers are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# (requests per minute, tokens per minute) for each model
+DEFAULT_LIMITS: Dict[str, Tuple[int, int]] = {
+    "gpt-4o": (500, 30000),
+    "gpt-4o-mini": (500, 200000)
+}
+
+# OpenAI enforces per-minute limits over much shorter windows (about a second)
+DEFAULT_WINDOW_SECONDS = 1.0
+DEFAULT_BURST_SECONDS = 0.25
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a request could not be scheduled within its timeout."""
+
+
+class MemoryBucketStore:
+    """Keeps token bucket state in memory, shared by all threads in the process."""
+    
+    def __init__(self):
+        """Initialize the store."""
+        self._state: Dict[str, list] = {}
+        self._lock = threading.Lock()
+    
+    def transact(self, update: Callable[[Dict[str, list]], float]) -> float:
+        """Run `update` on the bucket state atomically and return its result."""
+        with self._lock:
+            return update(self._state)
+
+
+class FileBucketStore:
+    """Keeps token bucket state in a locked JSON file, shared between processes."""
+    
+    def __init__(self, path: str):
+        """
+        Initialize the store.
+        
+        Args:
+            path: File holding the shared bucket state
+        """
+        self.path = path
+        self._lock = threading.Lock()
+    
+    def transact(self, update: Callable[[Dict[str, list]], float]) -> float:
+        """Run `update` on the bucket state atomically and return its result."""
+        with self._lock, open(self.path, 'a+') as f:
+            _lock_file(f)
+            try:
+                f.seek(0)
+                data = f.read()
+                state = json.loads(data) if data else {}
+                result = update(state)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+                return result
+            finally:
+                _unlock_file(f)
+
+
+def _lock_file(f):
+    """Take an exclusive lock on an open file."""
+    if os.name == 'nt':
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _unlock_file(f):
+    """Release a lock taken with _lock_file."""
+    if os.name == 'nt':
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class RateLimiter:
+    """
+    Token-bucket scheduler for API requests.
+    
+    Each model has a request bucket and a token bucket. Buckets hold
+    `burst_seconds` worth of quota and refill somewhat below the per-minute
+    limits, so that a full bucket plus its refill never exceeds what the API
+    allows within one of its `window_seconds` enforcement windows.
+    
+    Waiting requests are served in priority order, then first come first
+    served. Priorities only order requests within one process; with a state
+    file, other processes compete for the shared quota on equal terms.
+    """
+    
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Tuple[int, int]]] = None,
+        state_path: Optional[str] = None,
+        burst_seconds: float = DEFAULT_BURST_SECONDS,
+        window_seconds: float = DEFAULT_WINDOW_SECONDS
+    ):
+        """
+        Initialize the rate limiter.
+        
+        Args:
+            limits: (requests per minute, tokens per minute) for each model;
+                models without limits are not throttled
+            state_path: Optional file to share quota with other processes
+            burst_seconds: How many seconds of quota can be spent at once
+            window_seconds: Length of the windows the API enforces its
+                per-minute limits over (60 for a true per-minute quota)
+        """
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.burst_seconds = burst_seconds
+        self.window_seconds = window_seconds
+        # Refill share that leaves room for a full burst in every window
+        self._refill_share = window_seconds / (window_seconds + burst_seconds)
+        self.store = FileBucketStore(state_path) if state_path else MemoryBucketStore()
+        self._cond = threading.Condition()
+        self._queues: Dict[str, list] = {}
+        self._sequence = itertools.count()
+    
+    def _capacity(self, per_minute: float) -> float:
+        """Bucket size for a per-minute limit."""
+        return max(1.0, per_minute * self.burst_seconds / 60.0)
+    
+    def _per_second(self, per_minute: float) -> float:
+        """Refill rate for a per-minute limit."""
+        return per_minute * self._refill_share / 60.0
+    
+    def _refill(self, state: Dict[str, list], key: str, per_minute: float, now: float) -> list:
+        """Bring a bucket up to date and return its [level, timestamp] entry."""
+        capacity = self._capacity(per_minute)
+        level, last = state.get(key, [capacity, now])
+        level = min(capacity, level + max(0.0, now - last) * self._per_second(per_minute))
+        state[key] = [level, now]
+        return state[key]
+    
+    def _try_take(self, model: str, tokens: int) -> float:
+        """
+        Take quota for one request if available.
+        
+        Returns:
+            0 if the quota was taken, otherwise seconds until it should be
+        """
+        requests_per_minute, tokens_per_minute = self.limits[model]
+        # A request larger than the bucket only waits for a full bucket, then
+        # leaves it in debt so later requests wait for the rest
+        needed = min(tokens, self._capacity(tokens_per_minute))
+        
+        def take(state):
+            now = time.time()
+            request_bucket = self._refill(state, f"{model}:requests", requests_per_minute, now)
+            token_bucket = self._refill(state, f"{model}:tokens", tokens_per_minute, now)
+            if request_bucket[0] >= 1 and token_bucket[0] >= needed:
+                request_bucket[0] -= 1
+                token_bucket[0] -= tokens
+                return 0.0
+            return max(
+                (1 - request_bucket[0]) / self._per_second(requests_per_minute),
+                (needed - token_bucket[0]) / self._per_second(tokens_per_minute),
+                0.001
+            )
+        
+        return self.store.transact(take)
+    
+    def acquire(
+        self,
+        model: str,
+        tokens: int,
+        priority: int = PRIORITY_INTERACTIVE,
+        timeout: Optional[float] = None
+    ) -> float:
+        """
+        Wait until a request may be sent.
+        
+        Args:
+            model: Model the request is for
+            tokens: Estimated tokens the request will use (prompt + max_tokens)
+            priority: PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND or any int
+            timeout: Maximum seconds to wait, or None to wait indefinitely
+        
+        Returns:
+            Seconds spent waiting in the queue
+        """
+        if model not in self.limits:
+            return 0.0
+        
+        start = time.monotonic()
+        entry = (priority, next(self._sequence))
+        with self._cond:
+            queue = self._queues.setdefault(model, [])
+            heapq.heappush(queue, entry)
+            try:
+                while True:
+                    wait = 0.25
+                    if queue[0] == entry:
+                        wait = self._try_take(model, tokens)
+                        if wait == 0:
+                            return time.monotonic() - start
+                        # Other processes may also be spending quota, so re-check regularly
+                        wait = min(wait, 0.25)
+                    
+                    if timeout is not None:
+                        remaining = timeout - (time.monotonic() - start)
+                        if remaining <= 0:
+                            raise RateLimitTimeout(f"Timed out waiting for {model} rate limit")
+                        wait = min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                queue.remove(entry)
+                heapq.heapify(queue)
+                self._cond.notify_all()
+    
+    def record_usage(self, model: str, estimated_tokens: int, actual_tokens: int):
+        """
+        Correct the token bucket once the real usage of a request is known.
+        
+        Args:
+            model: Model the request was for
+            estimated_tokens: Tokens passed to acquire
+            actual_tokens: Tokens the API reported using
+        """
+        if model not in self.limits:
+            return
+        tokens_per_minute = self.limits[model][1]
+        
+        def adjust(state):
+            bucket = self._refill(state, f"{model}:tokens", tokens_per_minute, time.time())
+            bucket[0] = min(self._capacity(tokens_per_minute), bucket[0] + estimated_tokens - actual_tokens)
+            return 0.0
+        
+        self.store.transact(adjust)
+        with self._cond:
+            self._cond.notify_all()
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Parse limits from a string like "gpt-4o:500:30000,gpt-4o-mini:500:200000".
+    
+    Returns:
+        (requests per minute, tokens per minute) for each model
+    """
+    limits = {}
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        model, requests_per_minute, tokens_per_minute = item.rsplit(':', 2)
+        limits[model] = (int(requests_per_minute), int(tokens_per_minute))
+    return limits
+
+
+def settings_from_env(environ: Optional[Dict[str, str]] = None) -> Optional[Dict]:
+    """
+    Read rate limiter settings from RATE_LIMITS, RATE_LIMIT_STATE_FILE and
+    RATE_LIMIT_BURST_SECONDS.
+    
+    Args:
+        environ: Environment to read (defaults to os.environ)
+    
+    Returns:
+        RateLimiter arguments, or None if rate limiting is not configured
+    """
+    environ = os.environ if environ is None else environ
+    rate_limits = environ.get('RATE_LIMITS')
+    state_path = environ.get('RATE_LIMIT_STATE_FILE')
+    if not rate_limits and not state_path:
+        return None
+    return {
+        "limits": parse_limits(rate_limits) if rate_limits else None,
+        "state_path": state_path or None,
+        "burst_seconds": float(environ.get('RATE_LIMIT_BURST_SECONDS') or DEFAULT_BURST_SECONDS)
+    }
+
+
+_default_limiter: Optional[RateLimiter] = None
+_default_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter(**kwargs) -> RateLimiter:
+    """
+    Get the process-wide rate limiter, creating it on first use.
+    
+    Args:
+        **kwargs: RateLimiter arguments, used only when it is first created
+    """
+    global _default_limiter
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            _default_limiter = RateLimiter(**kwargs)
+        return _default_limiter
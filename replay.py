@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Replay tool for recorded CommentBot turns.
+Re-runs turn bundles through the current ScreenCapture, AICharacter and
+VoiceOutput code, with the OpenAI API mocked at its recorded latency, so
+different versions can be compared deterministically. Speech recognition is
+an external service and is not replayed.
+
+Usage:
+    python replay.py recordings/
+    python replay.py recordings/ --save baseline.json
+    python replay.py recordings/ --baseline baseline.json --max-regression 0.2
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+from types import SimpleNamespace
+from typing import Dict, List
+
+from turn_recorder import TurnRecord
+
+
+class RecordedClient:
+    """Stands in for the OpenAI client, answering with the recorded response after the recorded latency."""
+    
+    def __init__(self, record: TurnRecord):
+        """
+        Initialize the mock client.
+        
+        Args:
+            record: Turn whose response and API latency are replayed
+        """
+        self.record = record
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+    
+    def _create(self, **request):
+        """Return the recorded completion."""
+        time.sleep(self.record.timings.get("api", 0.0))
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self.record.response), finish_reason="stop")],
+            usage=None
+        )
+
+
+def replay_turn(record: TurnRecord, tts_backend: str = "null") -> Dict[str, float]:
+    """
+    Replay one turn through the current pipeline code.
+    
+    Args:
+        record: Turn to replay
+        tts_backend: TTS backend used to measure time to first audio
+    
+    Returns:
+        Replayed stage timings in seconds
+    """
+    from screen_capture import ScreenCapture
+    from ai_character import AICharacter
+    from voice_output import VoiceOutput, NullSink, create_backend
+    
+    timings = {}
+    
+    # Re-encode the full-resolution capture so the real resize and encode are timed
+    screen_data = record.screen_base64
+    if record.screen_frame is not None:
+        start = time.perf_counter()
+        screen_data = ScreenCapture.encode_base64(record.screen_frame)
+        timings["screen_encode"] = time.perf_counter() - start
+    
+    if record.request:
+        ai = AICharacter(api_key="replay")
+        ai.client = RecordedClient(record)
+        # Restore the history that preceded this turn
+        ai.conversation_history = ai.conversation_history[:1] + record.request["messages"][1:-1]
+        start = time.perf_counter()
+        ai.chat(record.transcript, screen_data, max_tokens=record.request.get("max_tokens", 500))
+        timings["chat"] = time.perf_counter() - start
+        timings["chat_overhead"] = timings["chat"] - record.timings.get("api", 0.0)
+    
+    if record.response:
+        voice_output = VoiceOutput(backend=create_backend(tts_backend), sink=NullSink())
+        voice_output.speak(record.response, blocking=True)
+        timings["tts_first_audio"] = voice_output.last_time_to_first_audio
+    
+    timings["total"] = sum(timings.get(stage, 0.0) for stage in ["screen_encode", "chat", "tts_first_audio"])
+    return timings
+
+
+def find_regressions(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    max_regression: float,
+    min_delta: float = 0.005
+) -> List[str]:
+    """
+    Compare replay results with a baseline.
+    
+    Args:
+        results: Stage timings per bundle
+        baseline: Stage timings per bundle from an earlier run
+        max_regression: Allowed slowdown as a fraction (0.2 = 20%)
+        min_delta: Slowdowns smaller than this many seconds are ignored as noise
+    
+    Returns:
+        A description of each regression found
+    """
+    regressions = []
+    for bundle, timings in results.items():
+        for stage, seconds in timings.items():
+            before = baseline.get(bundle, {}).get(stage)
+            if before is None:
+                continue
+            if seconds > before * (1 + max_regression) and seconds - before > min_delta:
+                regressions.append(f"{bundle} {stage}: {before * 1000:.1f}ms -> {seconds * 1000:.1f}ms")
+    return regressions
+
+
+def main():
+    """Replay recorded turns and optionally gate on latency regressions."""
+    parser = argparse.ArgumentParser(description="Replay recorded CommentBot turns")
+    parser.add_argument("path", help="Turn bundle or directory of bundles (RECORD_TURNS_DIR)")
+    parser.add_argument("--tts-backend", default="null", help="TTS backend to measure (default: null)")
+    parser.add_argument("--save", help="Write replay timings to this JSON file")
+    parser.add_argument("--baseline", help="Compare against timings saved with --save")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed slowdown per stage as a fraction (default: 0.2)")
+    args = parser.parse_args()
+    
+    if os.path.isdir(args.path):
+        bundles = sorted(glob.glob(os.path.join(args.path, "*.zip")))
+    else:
+        bundles = [args.path]
+    if not bundles:
+        print(f"No turn bundles found in {args.path}")
+        return 1
+    
+    results = {}
+    for path in bundles:
+        record = TurnRecord.load(path)
+        timings = replay_turn(record, args.tts_backend)
+        name = os.path.basename(path)
+        results[name] = timings
+        
+        print(f"\n{name}: \"{record.transcript}\"")
+        for stage, seconds in timings.items():
+            recorded = record.timings.get(stage)
+            recorded_text = f"{recorded * 1000:.1f}ms" if recorded is not None else "-"
+            print(f"  {stage:16} recorded {recorded_text:>10}   replayed {seconds * 1000:.1f}ms")
+    
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved timings to {args.save}")
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.max_regression)
+        if regressions:
+            print(f"\n✗ {len(regressions)} latency regression(s) over {args.max_regression:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\n✓ No latency regressions over {args.max_regression:.0%}")
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
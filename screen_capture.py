@@ -5,18 +5,95 @@ Captures screenshots that can be shared with the AI for visual context.
 """
 
 import io
+import time
 import base64
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Optional
 from PIL import Image
 import mss
 
 
+class PendingCapture:
+    """A screen capture running on a worker thread."""
+    
+    def __init__(self, executor: ThreadPoolExecutor, capture, *args, finish=None):
+        """
+        Submit a capture to the executor.
+        
+        Args:
+            executor: Executor to run the capture on
+            capture: Function returning the base64 screenshot, or a frame for `finish`
+            *args: Arguments for the capture function
+            finish: Optional function run on the captured value in the thread
+                that calls `result`, e.g. to encode a grabbed frame
+        """
+        self.capture_seconds = 0.0
+        self.wait_seconds = 0.0
+        self._finish = finish
+        self._future: Future = executor.submit(self._run, capture, *args)
+    
+    def _run(self, capture, *args) -> Optional[str]:
+        """Internal method that times the capture on the worker thread."""
+        start = time.perf_counter()
+        try:
+            return capture(*args)
+        finally:
+            self.capture_seconds = time.perf_counter() - start
+    
+    def result(self, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Wait for the capture to finish.
+        
+        Returns:
+            Base64 encoded string of the image, or None if capture fails
+        """
+        start = time.perf_counter()
+        try:
+            value = self._future.result(timeout)
+        except Exception as e:
+            print(f"Error capturing screen: {e}")
+            return None
+        finally:
+            self.wait_seconds = time.perf_counter() - start
+        
+        if self._finish is None or value is None:
+            return value
+        try:
+            return self._finish(value)
+        except Exception as e:
+            print(f"Error capturing screen: {e}")
+            return None
+    
+    @property
+    def seconds_saved(self) -> float:
+        """Capture time that overlapped with other work instead of being waited on."""
+        return max(0.0, self.capture_seconds - self.wait_seconds)
+    
+    def cancel(self):
+        """Cancel the capture if it has not started yet."""
+        self._future.cancel()
+
+
 class ScreenCapture:
     """Handles screen capturing functionality."""
     
     def __init__(self):
         """Initialize the screen capture system."""
         self.sct = mss.mss()
+        self._owner_thread = threading.current_thread()
+        self._local = threading.local()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._last_frame: Optional[Image.Image] = None
+    
+    def _grabber(self):
+        """Get an mss instance usable from the current thread."""
+        # mss handles are bound to the thread that created them
+        if threading.current_thread() is self._owner_thread:
+            return self.sct
+        if not hasattr(self._local, 'sct'):
+            self._local.sct = mss.mss()
+        return self._local.sct
     
     def capture_screen(self, monitor_number: int = 1) -> Optional[Image.Image]:
         """
@@ -29,14 +106,17 @@ class ScreenCapture:
             PIL Image object of the screenshot, or None if capture fails
         """
         try:
+            sct = self._grabber()
+            
             # Get the monitor
-            monitor = self.sct.monitors[monitor_number]
+            monitor = sct.monitors[monitor_number]
             
             # Capture the screen
-            screenshot = self.sct.grab(monitor)
+            screenshot = sct.grab(monitor)
             
             # Convert to PIL Image
             img = Image.frombytes("RGB", screenshot.size, screenshot.bgra, "raw", "BGRX")
+            self._last_frame = img
             return img
         except Exception as e:
             print(f"Error capturing screen: {e}")
@@ -56,9 +136,26 @@ class ScreenCapture:
         img = self.capture_screen(monitor_number)
         if img is None:
             return None
+        return self.encode_base64(img, max_size)
+    
+    @staticmethod
+    def encode_base64(img: Image.Image, max_size: tuple = (1024, 768)) -> str:
+        """
+        Resize an image and encode it as base64 PNG.
         
-        # Resize if needed to reduce API costs
-        img.thumbnail(max_size, Image.Resampling.LANCZOS)
+        Args:
+            img: Image to encode (left unchanged)
+            max_size: Maximum dimensions to resize to (width, height)
+        
+        Returns:
+            Base64 encoded string of the image
+        """
+        # Resize if needed to reduce API costs, into a new image so the
+        # full-resolution frame stays available (same cost as thumbnail())
+        scale = min(max_size[0] / img.width, max_size[1] / img.height)
+        if scale < 1:
+            size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            img = img.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
         
         # Convert to base64
         buffer = io.BytesIO()
@@ -68,11 +165,59 @@ class ScreenCapture:
         
         return img_base64
     
+    def capture_async(self, monitor_number: int = 1, max_size: tuple = (1024, 768)) -> PendingCapture:
+        """
+        Start capturing and encoding the screen on a worker thread.
+        
+        Lets the capture overlap with speech recognition so the image is
+        ready by the time it is needed.
+        
+        Args:
+            monitor_number: Monitor index
+            max_size: Maximum dimensions to resize to (width, height)
+        
+        Returns:
+            PendingCapture whose result is the base64 screenshot
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="screen-capture")
+        return PendingCapture(self._executor, self.capture_as_base64, monitor_number, max_size)
+    
+    def grab_async(self, monitor_number: int = 1, max_size: tuple = (1024, 768)) -> PendingCapture:
+        """
+        Start grabbing the screen on a worker thread, leaving the encoding for later.
+        
+        Only the grab overlaps with speech recognition. The resize and PNG
+        encode run in the thread that calls `result`, and only if the
+        screenshot is actually needed, so this saves CPU on turns that never
+        share the screen but saves little latency on those that do; use
+        `capture_async` to overlap the encode as well.
+        
+        Args:
+            monitor_number: Monitor index
+            max_size: Maximum dimensions to resize to (width, height)
+        
+        Returns:
+            PendingCapture whose result is the base64 screenshot
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="screen-capture")
+        return PendingCapture(
+            self._executor, self.capture_screen, monitor_number,
+            finish=lambda img: self.encode_base64(img, max_size)
+        )
+    
     def get_monitor_count(self) -> int:
         """Get the number of available monitors."""
         return len(self.sct.monitors) - 1  # -1 because index 0 is all monitors combined
     
+    def get_last_frame(self) -> Optional[Image.Image]:
+        """Get the full-resolution frame from the most recent capture, before resizing."""
+        return self._last_frame
+    
     def __del__(self):
         """Clean up resources."""
+        if getattr(self, '_executor', None) is not None:
+            self._executor.shutdown(wait=False)
         if hasattr(self, 'sct'):
             self.sct.close()
@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""
+Tests for the CommentBot logic that needs no microphone, speakers, display or
+API key. Run with: python test_logic.py (or pytest test_logic.py)
+"""
+
+import sys
+import traceback
+from types import SimpleNamespace
+
+import numpy as np
+
+
+# Audio format used by the synthetic microphone
+CHUNK = 1024
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+CHUNK_BYTES = CHUNK * SAMPLE_WIDTH
+
+
+def _pcm(chunks: int, amplitude: int = 0) -> bytes:
+    """Synthetic 16-bit PCM: silence, or a 440 Hz tone of the given amplitude."""
+    t = np.arange(chunks * CHUNK) / SAMPLE_RATE
+    return (np.sin(2 * np.pi * 440 * t) * amplitude).astype(np.int16).tobytes()
+
+
+def _voice_input(ring):
+    """A VoiceInput reading from `ring`, without opening a microphone."""
+    import speech_recognition as sr
+    from voice_input import VoiceInput
+    
+    voice_input = VoiceInput.__new__(VoiceInput)
+    voice_input.recognizer = sr.Recognizer()
+    voice_input.microphone = SimpleNamespace(CHUNK=CHUNK, SAMPLE_RATE=SAMPLE_RATE, SAMPLE_WIDTH=SAMPLE_WIDTH)
+    voice_input._ring = ring
+    voice_input._read_pos = 0
+    voice_input.speech_start_callback = None
+    return voice_input
+
+
+def _write_chunks(ring, data: bytes):
+    """Write audio into the ring one microphone chunk at a time."""
+    for offset in range(0, len(data), CHUNK_BYTES):
+        ring.write(data[offset:offset + CHUNK_BYTES])
+
+
+def test_ring_buffer_wraparound():
+    """Reads spanning the end of the buffer come back in order."""
+    from voice_input import AudioRingBuffer
+    
+    ring = AudioRingBuffer(10)
+    ring.write(b"abcdef")
+    ring.write(b"ghijkl")
+    assert ring.write_position == 12
+    assert ring.oldest_position == 2
+    assert len(ring.slice(2, 12)) == 2
+    assert ring.read(2, 12) == b"cdefghijkl"
+    assert ring.read(8, 11) == b"ijk"
+
+
+def test_ring_buffer_overrun():
+    """Ranges the writer has lapped are rejected instead of returned torn."""
+    from voice_input import AudioRingBuffer
+    
+    ring = AudioRingBuffer(8)
+    ring.write(b"01234567")
+    ring.write(b"89ab")
+    for start, end in [(0, 8), (3, 6)]:
+        try:
+            ring.read(start, end)
+        except ValueError:
+            continue
+        raise AssertionError(f"read({start}, {end}) returned overwritten data")
+    assert ring.read(4, 12) == b"456789ab"
+
+
+def test_ring_buffer_gives_up_bytes_before_overwriting():
+    """oldest_position moves past a region before the writer copies over it."""
+    from voice_input import AudioRingBuffer
+    
+    ring = AudioRingBuffer(8)
+    ring.write(b"01234567")
+    seen = []
+    
+    class WatchedView:
+        def __init__(self, view):
+            self.view = view
+        
+        def __getitem__(self, key):
+            return self.view[key]
+        
+        def __setitem__(self, key, value):
+            seen.append(ring.oldest_position)
+            self.view[key] = value
+    
+    ring._view = WatchedView(ring._view)
+    ring.write(b"89ab")
+    assert seen and all(position == 4 for position in seen)
+
+
+def test_endpointing():
+    """An utterance is cut out with pre-roll before it and a pause after it."""
+    from voice_input import AudioRingBuffer
+    
+    ring = AudioRingBuffer(64 * CHUNK_BYTES)
+    _write_chunks(ring, _pcm(16) + _pcm(16, 3000) + _pcm(24))
+    voice_input = _voice_input(ring)
+    starts = []
+    voice_input.speech_start_callback = lambda: starts.append(True)
+    
+    start, end = voice_input._next_utterance(timeout=1, phrase_time_limit=None)
+    # 0.5s of pre-roll rounded down to whole chunks
+    assert start == (16 - 7) * CHUNK_BYTES
+    # 0.8s of silence after the tone, rounded up to whole chunks
+    assert end == (32 + 13) * CHUNK_BYTES
+    assert starts == [True]
+    
+    audio = voice_input._audio_from_ring(start, end)
+    assert audio.frame_data == ring.read(start, end)
+    
+    # Nothing but silence is left
+    assert voice_input._next_utterance(timeout=0.2, phrase_time_limit=None) is None
+
+
+def test_endpointing_after_overrun():
+    """A reader a whole buffer behind skips to the oldest audio still held."""
+    from voice_input import AudioRingBuffer
+    
+    ring = AudioRingBuffer(30 * CHUNK_BYTES)
+    _write_chunks(ring, _pcm(16) + _pcm(16, 3000) + _pcm(24))
+    voice_input = _voice_input(ring)
+    
+    start, end = voice_input._next_utterance(timeout=1, phrase_time_limit=None)
+    assert start == ring.oldest_position == 26 * CHUNK_BYTES
+    assert end == (32 + 13) * CHUNK_BYTES
+
+
+def test_endpointing_keeps_speech_when_capture_stops():
+    """Speech in progress when the ring closes is still returned."""
+    from voice_input import AudioRingBuffer
+    
+    ring = AudioRingBuffer(64 * CHUNK_BYTES)
+    _write_chunks(ring, _pcm(16) + _pcm(8, 3000))
+    ring.close()
+    voice_input = _voice_input(ring)
+    
+    assert voice_input._next_utterance(timeout=1, phrase_time_limit=None) == (9 * CHUNK_BYTES, 24 * CHUNK_BYTES)
+    assert voice_input._next_utterance(timeout=1, phrase_time_limit=None) is None
+
+
+def test_endpointing_skips_clicks():
+    """Sounds shorter than phrase_threshold are not utterances and start no prefetch."""
+    from voice_input import AudioRingBuffer
+    
+    ring = AudioRingBuffer(128 * CHUNK_BYTES)
+    # A one-chunk click, then 0.5s of speech
+    _write_chunks(ring, _pcm(16) + _pcm(1, 3000) + _pcm(24) + _pcm(8, 3000) + _pcm(24))
+    voice_input = _voice_input(ring)
+    voice_input.recognizer.dynamic_energy_threshold = False
+    starts = []
+    voice_input.speech_start_callback = lambda: starts.append(True)
+    
+    start, end = voice_input._next_utterance(timeout=1, phrase_time_limit=None)
+    assert start == (41 - 7) * CHUNK_BYTES
+    assert end == (49 + 13) * CHUNK_BYTES
+    assert starts == [True]
+    
+    # A click right before capture stops is dropped too
+    ring = AudioRingBuffer(64 * CHUNK_BYTES)
+    _write_chunks(ring, _pcm(16) + _pcm(1, 3000) + _pcm(2))
+    ring.close()
+    voice_input = _voice_input(ring)
+    assert voice_input._next_utterance(timeout=1, phrase_time_limit=None) is None
+
+
+def test_endpointing_adapts_energy_threshold():
+    """With dynamic_energy_threshold, the threshold follows the noise before speech."""
+    from voice_input import AudioRingBuffer
+    
+    ring = AudioRingBuffer(256 * CHUNK_BYTES)
+    # Noise just under the calibrated threshold (RMS 250), then louder noise
+    # above it (RMS 330), then speech
+    _write_chunks(ring, _pcm(48, 354) + _pcm(32, 467) + _pcm(16, 3000) + _pcm(24))
+    ring.close()
+    voice_input = _voice_input(ring)
+    voice_input.recognizer.energy_threshold = 300
+    
+    start, end = voice_input._next_utterance(timeout=1, phrase_time_limit=None)
+    # The threshold rose with the noise, so only the speech is an utterance
+    assert start == (80 - 7) * CHUNK_BYTES
+    assert end == (96 + 13) * CHUNK_BYTES
+    assert voice_input.recognizer.energy_threshold > 330
+    
+    # Without adaptation the louder noise is taken for speech
+    voice_input = _voice_input(ring)
+    voice_input.recognizer.energy_threshold = 300
+    voice_input.recognizer.dynamic_energy_threshold = False
+    start, _ = voice_input._next_utterance(timeout=1, phrase_time_limit=None)
+    assert start == (48 - 7) * CHUNK_BYTES
+
+
+def test_empty_base_url_falls_back_to_openai():
+    """A blank OPENAI_BASE_URL, as a copied .env.example used to leave, still reaches OpenAI."""
+    import os
+    from ai_character import AICharacter, DEFAULT_BASE_URL
+    
+    saved = os.environ.get("OPENAI_BASE_URL")
+    os.environ["OPENAI_BASE_URL"] = ""
+    try:
+        ai = AICharacter(api_key="test", base_url=None)
+        assert str(ai.client.base_url).rstrip("/") == DEFAULT_BASE_URL
+        os.environ["OPENAI_BASE_URL"] = "http://localhost:8000/v1"
+        ai = AICharacter(api_key="test")
+        assert str(ai.client.base_url).rstrip("/") == "http://localhost:8000/v1"
+    finally:
+        if saved is None:
+            del os.environ["OPENAI_BASE_URL"]
+        else:
+            os.environ["OPENAI_BASE_URL"] = saved
+
+
+def test_history_trimming_keeps_prefix_stable():
+    """History is dropped in chunks, so the prompt prefix survives several turns."""
+    from ai_character import AICharacter
+    
+    ai = AICharacter(api_key="test", max_history_messages=20, history_trim_chunk=10)
+    system = ai.conversation_history[0]
+    prefixes = []
+    for turn in range(30):
+        ai.conversation_history.append({"role": "user", "content": f"question {turn}"})
+        ai.conversation_history.append({"role": "assistant", "content": f"answer {turn}"})
+        ai._trim_history()
+        history = ai.conversation_history
+        assert history[0] is system
+        assert len(history) - 1 <= 20
+        assert history[1]["role"] == "user"
+        prefixes.append(history[1]["content"])
+    
+    # The oldest kept message changes once per chunk, not on every turn
+    changes = sum(1 for before, after in zip(prefixes, prefixes[1:]) if before != after)
+    assert changes <= 30 // 5
+    assert prefixes[-1] != prefixes[0]
+
+
+def test_history_trimming_starts_on_user_message():
+    """The kept history never starts with an orphaned assistant reply."""
+    from ai_character import AICharacter
+    
+    ai = AICharacter(api_key="test", max_history_messages=6, history_trim_chunk=3)
+    ai.conversation_history += [
+        {"role": "user", "content": "a"},
+        {"role": "assistant", "content": "b"},
+        {"role": "assistant", "content": "c"},
+        {"role": "assistant", "content": "d"},
+        {"role": "user", "content": "e"},
+        {"role": "assistant", "content": "f"},
+        {"role": "user", "content": "g"}
+    ]
+    ai._trim_history()
+    assert [message["content"] for message in ai.conversation_history[1:]] == ["e", "f", "g"]
+
+
+def test_rate_limiter_against_quota_server():
+    """Bots scheduled through the limiter never get a 429, and voice turns wait little."""
+    from benchmarks import MockQuotaServer, run_quota_clients
+    from rate_limiter import RateLimiter, settings_from_env, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+    
+    server = MockQuotaServer(1200, 200000, window_seconds=1.0)
+    try:
+        # Exactly the settings CommentBot builds its limiter from
+        limiter = RateLimiter(**settings_from_env({"RATE_LIMITS": "mock:1200:200000"}))
+        delays = run_quota_clients(server.url, limiter, clients=10, requests_per_client=4)
+    finally:
+        server.close()
+    
+    assert server.rejected == 0, f"{server.rejected} requests were rejected with 429"
+    assert server.accepted == 40
+    assert max(delays[PRIORITY_INTERACTIVE]) < 2.0
+    assert max(delays[PRIORITY_BACKGROUND]) < 5.0
+
+
+def test_rate_limiter_charges_large_requests_in_full():
+    """A request bigger than the token bucket leaves it in debt instead of being undercharged."""
+    from rate_limiter import RateLimiter, RateLimitTimeout
+    
+    # A 100-token bucket refilling at 50 tokens a second
+    limiter = RateLimiter({"mock": (60000, 6000)}, burst_seconds=1.0, window_seconds=1.0)
+    assert limiter.acquire("mock", 300) < 0.1
+    try:
+        limiter.acquire("mock", 1, timeout=0.5)
+    except RateLimitTimeout:
+        pass
+    else:
+        raise AssertionError("the oversized request was not charged in full")
+    
+    # Reporting the real, smaller usage pays the debt back
+    limiter.record_usage("mock", 300, 100)
+    assert limiter.acquire("mock", 1, timeout=0.5) < 0.5
+
+
+def test_speaking_budget_sentences():
+    """Abbreviations, initials and decimals don't end sentences."""
+    from voice_output import SpeakingBudget
+    
+    budget = SpeakingBudget()
+    assert budget.sentences("Mr. J. Smith paid $3.50 for it. Then he left! Why? Because e.g. rain.") == [
+        "Mr. J. Smith paid $3.50 for it.", "Then he left!", "Why?", "Because e.g. rain."
+    ]
+    assert budget.sentences("So did I. Then we went home.") == ["So did I.", "Then we went home."]
+
+
+def test_speaking_budget_complete_sentences():
+    """A cut-off tail is dropped, unless that would leave only a fragment."""
+    from voice_output import SpeakingBudget
+    
+    budget = SpeakingBudget()
+    assert budget.complete_sentences("Dr. Smith went to the store and") == "Dr. Smith went to the store and"
+    assert budget.complete_sentences("Hi. So what I was") == "Hi. So what I was"
+    assert budget.complete_sentences("That looks great. You fixed the bug in version 3.5 and") == "That looks great."
+    assert budget.complete_sentences("All done here. Nice work!") == "All done here. Nice work!"
+
+
+def test_speaking_budget_split():
+    """Answers are split at a sentence boundary that fits the budget."""
+    from voice_output import SpeakingBudget
+    
+    # 150 words per minute for 4 seconds is 10 words
+    budget = SpeakingBudget(max_seconds=4, rate=150)
+    assert budget.max_words == 10
+    assert budget.split("Short answer here.") == ("Short answer here.", "")
+    assert budget.split("Dr. Smith went to the store and bought milk. He then went home to rest.") == (
+        "Dr. Smith went to the store and bought milk.", "He then went home to rest."
+    )
+    # A leading fragment is not spoken on its own
+    assert budget.split("Hi. The quick brown fox jumps over the lazy dog. Then it slept all afternoon.") == (
+        "Hi. The quick brown fox jumps over the lazy dog.", "Then it slept all afternoon."
+    )
+
+
+def test_speaking_budget_calibration():
+    """Measured speaking time moves the words-per-budget estimate."""
+    from voice_output import SpeakingBudget
+    
+    budget = SpeakingBudget(max_seconds=10, rate=150)
+    assert budget.max_words == 25
+    for _ in range(20):
+        budget.record("one two three four five", 5.0)
+    assert budget.max_words == 10
+    assert budget.turn_seconds == [5.0] * 20
+
+
+def test_null_backend_is_silent():
+    """The null backend speaks into a NullSink without opening an audio device."""
+    from voice_output import VoiceOutput, NullSink, create_backend
+    
+    voice_output = VoiceOutput(backend=create_backend("null", rate=600))
+    assert isinstance(voice_output.sink, NullSink)
+    timings = []
+    voice_output.speak("one two three four five", blocking=True, callback=lambda *t: timings.append(t))
+    assert voice_output.sink.bytes_written > 0
+    assert timings and abs(timings[0][1] - 0.5) < 0.01
+
+
+def test_speech_callback_runs_outside_speech_lock():
+    """A slow per-utterance callback (e.g. saving a turn) doesn't delay the next utterance."""
+    from voice_output import VoiceOutput, create_backend
+    
+    voice_output = VoiceOutput(backend=create_backend("null", rate=6000))
+    held = []
+    voice_output.speak("hello there", blocking=True, callback=lambda *t: held.append(voice_output._speak_lock.locked()))
+    assert held == [False]
+
+
+def test_turn_record_round_trip():
+    """A saved bundle loads back with its images, audio and full-resolution frame."""
+    import base64
+    import io
+    import os
+    import tempfile
+    from PIL import Image
+    from turn_recorder import TurnRecord, DATA_URL_PREFIX
+    
+    frame = Image.new("RGB", (64, 48), (10, 20, 30))
+    buffer = io.BytesIO()
+    frame.resize((32, 24)).save(buffer, format="PNG")
+    screen = base64.b64encode(buffer.getvalue()).decode('utf-8')
+    
+    record = TurnRecord()
+    record.transcript = "look at my screen"
+    record.response = "Nice code!"
+    record.request = {"model": "gpt-4o", "messages": [
+        {"role": "system", "content": "Be nice."},
+        {"role": "user", "content": [
+            {"type": "text", "text": "look at my screen"},
+            {"type": "image_url", "image_url": {"url": DATA_URL_PREFIX + screen}}
+        ]}
+    ]}
+    record.timings = {"recognize": 0.5, "chat": 1.2, "tts_first_audio": 0.1}
+    record.audio_wav = b"RIFF" + bytes(40)
+    record.screen_base64 = screen
+    record.screen_frame = frame
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "turn.zip")
+        record.save(path)
+        loaded = TurnRecord.load(path)
+    
+    assert loaded.transcript == record.transcript
+    assert loaded.response == record.response
+    assert loaded.request == record.request
+    assert loaded.timings == record.timings
+    assert loaded.audio_wav == record.audio_wav
+    assert loaded.screen_base64 == screen
+    assert loaded.screen_frame.size == frame.size
+    assert loaded.screen_frame.tobytes() == frame.tobytes()
+
+
+def test_find_regressions():
+    """Only slowdowns past both the ratio and the noise floor are reported."""
+    from replay import find_regressions
+    
+    baseline = {"turn-1.zip": {"chat": 1.0, "screen_encode": 0.002, "recognize": 0.5}}
+    results = {
+        "turn-1.zip": {"chat": 1.3, "screen_encode": 0.004, "recognize": 0.55, "tts_first_audio": 0.2},
+        "turn-2.zip": {"chat": 9.0}
+    }
+    regressions = find_regressions(results, baseline, max_regression=0.2)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("turn-1.zip chat:")
+
+
+def main():
+    """Run all tests."""
+    print("=== CommentBot Logic Tests ===\n")
+    
+    tests = [(name, test) for name, test in globals().items() if name.startswith("test_") and callable(test)]
+    failed = 0
+    for name, test in tests:
+        try:
+            test()
+            print(f"✓ PASS: {name}")
+        except Exception:
+            failed += 1
+            print(f"✗ FAIL: {name}")
+            traceback.print_exc()
+    
+    if failed:
+        print(f"\n✗ {failed} of {len(tests)} tests failed.")
+        return 1
+    print(f"\n✓ All {len(tests)} tests passed!")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
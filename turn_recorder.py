@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Turn recorder module for the AI Character Bot.
+Saves everything about a conversation turn (audio, transcript, screen, API
+request and response, stage timings) so slow turns can be replayed later.
+"""
+
+import io
+import os
+import json
+import time
+import base64
+import hashlib
+import zipfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+from PIL import Image
+
+DATA_URL_PREFIX = "data:image/png;base64,"
+BUNDLE_URL_PREFIX = "bundle:"
+
+
+class TurnRecord:
+    """Everything needed to replay one conversation turn."""
+    
+    def __init__(self):
+        """Initialize an empty record."""
+        self.created = time.time()
+        self.transcript = ""
+        self.response = ""
+        self.request: Dict = {}
+        self.timings: Dict[str, float] = {}
+        self.audio_wav: Optional[bytes] = None
+        self.screen_base64: Optional[str] = None
+        # Full-resolution capture the screenshot was encoded from
+        self.screen_frame: Optional[Image.Image] = None
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Time a stage of the turn and store it under `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - start
+    
+    def save(self, path: str):
+        """
+        Write the record as a zip bundle.
+        
+        Images are stored once each as PNG files and referenced from the
+        request, rather than kept as base64 inside the JSON.
+        
+        Args:
+            path: Bundle file to write
+        """
+        images: Dict[str, bytes] = {}
+        
+        def store_image(data_base64: str) -> str:
+            png = base64.b64decode(data_base64)
+            name = f"images/{hashlib.sha1(png).hexdigest()}.png"
+            images[name] = png
+            return name
+        
+        messages = []
+        for message in self.request.get("messages", []):
+            content = message["content"]
+            if isinstance(content, list):
+                content = [self._externalize_part(part, store_image) for part in content]
+            messages.append(dict(message, content=content))
+        
+        metadata = {
+            "created": self.created,
+            "transcript": self.transcript,
+            "response": self.response,
+            "request": dict(self.request, messages=messages) if self.request else {},
+            "timings": self.timings,
+            "screen": store_image(self.screen_base64) if self.screen_base64 else None,
+            "screen_frame": "screen-frame.png" if self.screen_frame is not None else None
+        }
+        
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as bundle:
+            bundle.writestr("turn.json", json.dumps(metadata, indent=2))
+            if self.audio_wav:
+                bundle.writestr("audio.wav", self.audio_wav)
+            if self.screen_frame is not None:
+                # Lossless, so replays encode exactly the pixels that were captured
+                frame = io.BytesIO()
+                self.screen_frame.save(frame, format="PNG", compress_level=1)
+                bundle.writestr(metadata["screen_frame"], frame.getvalue(), compress_type=zipfile.ZIP_STORED)
+            # PNGs are already compressed
+            for name, png in images.items():
+                bundle.writestr(name, png, compress_type=zipfile.ZIP_STORED)
+    
+    @staticmethod
+    def _externalize_part(part: Dict, store_image) -> Dict:
+        """Replace an inline image in a message part with a bundle reference."""
+        url = part.get("image_url", {}).get("url", "")
+        if part.get("type") != "image_url" or not url.startswith(DATA_URL_PREFIX):
+            return part
+        return dict(part, image_url={"url": BUNDLE_URL_PREFIX + store_image(url[len(DATA_URL_PREFIX):])})
+    
+    @classmethod
+    def load(cls, path: str) -> "TurnRecord":
+        """
+        Read a record from a zip bundle.
+        
+        Args:
+            path: Bundle file to read
+        
+        Returns:
+            The record, with images inlined in the request again
+        """
+        record = cls()
+        with zipfile.ZipFile(path) as bundle:
+            metadata = json.loads(bundle.read("turn.json"))
+            
+            def inline(name: str) -> str:
+                return base64.b64encode(bundle.read(name)).decode('utf-8')
+            
+            messages = []
+            for message in metadata["request"].get("messages", []):
+                content = message["content"]
+                if isinstance(content, list):
+                    content = [cls._inline_part(part, inline) for part in content]
+                messages.append(dict(message, content=content))
+            
+            record.created = metadata["created"]
+            record.transcript = metadata["transcript"]
+            record.response = metadata["response"]
+            record.request = dict(metadata["request"], messages=messages) if metadata["request"] else {}
+            record.timings = metadata["timings"]
+            record.screen_base64 = inline(metadata["screen"]) if metadata["screen"] else None
+            if metadata.get("screen_frame"):
+                record.screen_frame = Image.open(io.BytesIO(bundle.read(metadata["screen_frame"])))
+                record.screen_frame.load()
+            if "audio.wav" in bundle.namelist():
+                record.audio_wav = bundle.read("audio.wav")
+        return record
+    
+    @staticmethod
+    def _inline_part(part: Dict, inline) -> Dict:
+        """Replace a bundle image reference in a message part with inline data."""
+        url = part.get("image_url", {}).get("url", "")
+        if part.get("type") != "image_url" or not url.startswith(BUNDLE_URL_PREFIX):
+            return part
+        return dict(part, image_url={"url": DATA_URL_PREFIX + inline(url[len(BUNDLE_URL_PREFIX):])})
+
+
+class TurnRecorder:
+    """Writes turn records to a directory, one bundle per turn."""
+    
+    def __init__(self, directory: str):
+        """
+        Initialize the recorder.
+        
+        Args:
+            directory: Where bundles are written (created if missing)
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._count = 0
+        self._lock = threading.Lock()
+    
+    def save(self, record: TurnRecord) -> Optional[str]:
+        """
+        Save a record as a new bundle. Safe to call from the speech thread.
+        
+        Returns:
+            Path of the bundle, or None if saving failed
+        """
+        with self._lock:
+            self._count += 1
+            count = self._count
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(record.created))
+        path = os.path.join(self.directory, f"turn-{stamp}-{count:04d}.zip")
+        try:
+            record.save(path)
+        except Exception as e:
+            print(f"Error saving turn recording: {e}")
+            return None
+        return path
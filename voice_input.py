@@ -4,8 +4,129 @@ Voice input module for the AI Character Bot.
 Handles speech recognition to convert user speech to text.
 """
 
+import asyncio
+import math
+import threading
+import time
+import numpy as np
 import speech_recognition as sr
-from typing import Optional
+from typing import Callable, List, Optional, Tuple
+
+
+class AudioRingBuffer:
+    """
+    Fixed-size, preallocated byte ring for raw PCM audio.
+    
+    Positions are absolute byte offsets counted from when the buffer was
+    created, so readers can hold on to them across wrap-arounds and detect
+    when the data they point at has been overwritten.
+    """
+    
+    def __init__(self, capacity: int):
+        """
+        Initialize the ring buffer.
+        
+        Args:
+            capacity: Size of the buffer in bytes
+        """
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._write_pos = 0
+        # End of the region being written; bytes older than this minus the
+        # capacity may already be overwritten
+        self._overwrite_pos = 0
+        self._closed = False
+        self._cond = threading.Condition()
+    
+    @property
+    def write_position(self) -> int:
+        """Absolute position one past the newest byte written."""
+        return self._write_pos
+    
+    @property
+    def oldest_position(self) -> int:
+        """Absolute position of the oldest byte still held in the buffer."""
+        return max(0, self._overwrite_pos - self.capacity)
+    
+    @property
+    def closed(self) -> bool:
+        """Whether the writer has closed the buffer."""
+        return self._closed
+    
+    def write(self, data: bytes):
+        """Append data, overwriting the oldest bytes once the buffer is full."""
+        data = memoryview(data)
+        length = len(data)
+        if length > self.capacity:
+            raise ValueError("Write is larger than the ring buffer capacity")
+        
+        # Give up the oldest bytes before overwriting them, so readers never
+        # treat a region that is being written as still held
+        with self._cond:
+            start = self._write_pos
+            self._overwrite_pos = start + length
+        
+        offset = start % self.capacity
+        first = min(length, self.capacity - offset)
+        self._view[offset:offset + first] = data[:first]
+        if first < length:
+            self._view[:length - first] = data[first:]
+        
+        with self._cond:
+            self._write_pos += length
+            self._cond.notify_all()
+    
+    def wait_for(self, position: int, timeout: Optional[float] = None) -> bool:
+        """
+        Block until data up to `position` has been written.
+        
+        Returns:
+            True if the data is available, False on timeout or close
+        """
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._write_pos >= position or self._closed,
+                timeout
+            )
+            return self._write_pos >= position
+    
+    def slice(self, start: int, end: int) -> List[memoryview]:
+        """
+        Get views onto the bytes between two absolute positions without copying.
+        
+        The views alias the buffer, so the writer can overwrite them once the
+        range falls behind `oldest_position`; use `read` to get a stable copy.
+        
+        Returns:
+            One view, or two when the range wraps around the end of the buffer
+        """
+        if start < self.oldest_position or end > self._write_pos or start > end:
+            raise ValueError(f"Range {start}-{end} is not held in the ring buffer")
+        
+        offset = start % self.capacity
+        length = end - start
+        if offset + length <= self.capacity:
+            return [self._view[offset:offset + length]]
+        return [self._view[offset:], self._view[:length - (self.capacity - offset)]]
+    
+    def read(self, start: int, end: int) -> bytes:
+        """
+        Copy the bytes between two absolute positions.
+        
+        Raises:
+            ValueError: If the range is not held, or was overwritten while it was copied
+        """
+        data = b"".join(self.slice(start, end))
+        if start < self.oldest_position:
+            raise ValueError(f"Range {start}-{end} was overwritten while it was read")
+        return data
+    
+    def close(self):
+        """Wake up any waiting readers; no more data will be written."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
 
 
 class VoiceInput:
@@ -16,12 +137,189 @@ class VoiceInput:
         self.recognizer = sr.Recognizer()
         self.microphone = sr.Microphone()
         
+        # Continuous capture state (see start_capture)
+        self._ring: Optional[AudioRingBuffer] = None
+        self._capture_thread: Optional[threading.Thread] = None
+        self._capture_stop = threading.Event()
+        self._read_pos = 0
+        
+        # Called as soon as an utterance is detected, before recognition runs
+        self.speech_start_callback: Optional[Callable[[], None]] = None
+        
+        # Optional workers.RecognizerWorker that runs recognition in another process
+        self.recognizer_worker = None
+        
+        # Audio and recognition time of the last utterance, for turn recording
+        self.last_audio: Optional[sr.AudioData] = None
+        self.last_recognition_seconds = 0.0
+        
         # Adjust for ambient noise on initialization
         print("Calibrating microphone for ambient noise... Please wait.")
         with self.microphone as source:
             self.recognizer.adjust_for_ambient_noise(source, duration=2)
         print("Microphone calibrated!")
     
+    @property
+    def is_capturing(self) -> bool:
+        """Whether the continuous capture thread is running."""
+        return self._capture_thread is not None and self._capture_thread.is_alive()
+    
+    def start_capture(self, buffer_seconds: float = 30.0):
+        """
+        Keep the microphone stream open and record into a ring buffer.
+        
+        While capturing, `listen` cuts utterances out of the buffer instead of
+        reopening the microphone, so speech that starts between turns is kept.
+        
+        Args:
+            buffer_seconds: How much audio the ring buffer holds
+        """
+        if self.is_capturing:
+            return
+        
+        mic = self.microphone
+        chunk_bytes = mic.CHUNK * mic.SAMPLE_WIDTH
+        chunks = max(1, int(buffer_seconds * mic.SAMPLE_RATE / mic.CHUNK))
+        self._ring = AudioRingBuffer(chunks * chunk_bytes)
+        self._read_pos = 0
+        self._capture_stop.clear()
+        
+        self._capture_thread = threading.Thread(target=self._capture_loop, args=(self._ring,))
+        self._capture_thread.daemon = True
+        self._capture_thread.start()
+    
+    def stop_capture(self):
+        """Stop the continuous capture thread and close the microphone stream."""
+        if self._capture_thread is None:
+            return
+        self._capture_stop.set()
+        self._capture_thread.join(timeout=2)
+        self._capture_thread = None
+    
+    def _capture_loop(self, ring: AudioRingBuffer):
+        """Internal method that reads microphone chunks into the ring buffer."""
+        try:
+            with self.microphone as source:
+                while not self._capture_stop.is_set():
+                    ring.write(source.stream.read(source.CHUNK))
+        except Exception as e:
+            print(f"Error during audio capture: {e}")
+        finally:
+            ring.close()
+    
+    @staticmethod
+    def _energy(data: bytes) -> float:
+        """RMS energy of 16-bit PCM audio, on the same scale as the recognizer threshold."""
+        samples = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+        return float(np.dot(samples, samples) / len(samples)) ** 0.5 if len(samples) else 0.0
+    
+    def _next_utterance(self, timeout: Optional[float], phrase_time_limit: Optional[float]) -> Optional[Tuple[int, int]]:
+        """
+        Find the next utterance in the ring buffer.
+        
+        Uses the recognizer's energy threshold and pause settings so the
+        endpointing matches `Recognizer.listen`: sounds shorter than
+        `phrase_threshold` (clicks, pops) are skipped, and with
+        `dynamic_energy_threshold` the threshold follows the background
+        noise while waiting for speech.
+        
+        Returns:
+            Absolute (start, end) positions of the utterance, or None on timeout
+            or if capture stopped before any speech
+        """
+        ring = self._ring
+        mic = self.microphone
+        recognizer = self.recognizer
+        chunk_bytes = mic.CHUNK * mic.SAMPLE_WIDTH
+        seconds_per_chunk = mic.CHUNK / mic.SAMPLE_RATE
+        bytes_per_second = mic.SAMPLE_RATE * mic.SAMPLE_WIDTH
+        pause_bytes = int(recognizer.pause_threshold * bytes_per_second)
+        phrase_bytes = math.ceil(recognizer.phrase_threshold / seconds_per_chunk) * chunk_bytes
+        pre_roll = int(recognizer.non_speaking_duration * bytes_per_second) // chunk_bytes * chunk_bytes
+        deadline = time.monotonic() + timeout if timeout else None
+        
+        pos = max(self._read_pos, ring.oldest_position)
+        start = None
+        speech_start = 0
+        announced = False
+        silence = 0
+        
+        while True:
+            if not ring.wait_for(pos + chunk_bytes, timeout=0.1):
+                if ring.closed:
+                    self._read_pos = pos
+                    # Hand over speech that was cut off by the end of capture
+                    if start is not None and pos - silence - speech_start >= phrase_bytes:
+                        return start, pos
+                    return None
+            else:
+                try:
+                    chunk = ring.read(pos, pos + chunk_bytes)
+                except ValueError:
+                    # Fell a whole buffer behind; skip to the oldest audio still held
+                    pos = ring.oldest_position
+                    if start is not None:
+                        start = max(start, pos)
+                        speech_start = max(speech_start, pos)
+                    continue
+                
+                energy = self._energy(chunk)
+                pos += chunk_bytes
+                
+                if start is None:
+                    if energy > recognizer.energy_threshold:
+                        start = max(pos - chunk_bytes - pre_roll, ring.oldest_position, self._read_pos)
+                        speech_start = pos - chunk_bytes
+                        announced = False
+                        silence = 0
+                    elif recognizer.dynamic_energy_threshold:
+                        # Same asymmetric weighted average as Recognizer.listen
+                        damping = recognizer.dynamic_energy_adjustment_damping ** seconds_per_chunk
+                        target = energy * recognizer.dynamic_energy_ratio
+                        recognizer.energy_threshold = recognizer.energy_threshold * damping + target * (1 - damping)
+                else:
+                    silence = silence + chunk_bytes if energy <= recognizer.energy_threshold else 0
+                
+                if start is not None:
+                    long_enough = pos - silence - speech_start >= phrase_bytes
+                    if long_enough and not announced:
+                        # Only real speech starts a screen prefetch, not a click
+                        announced = True
+                        self._notify_speech_start()
+                    too_long = phrase_time_limit and pos - start >= phrase_time_limit * bytes_per_second
+                    if silence >= pause_bytes or too_long:
+                        if long_enough:
+                            self._read_pos = pos
+                            return start, pos
+                        # Too short to be speech; keep waiting
+                        start = None
+            
+            if start is None and deadline is not None and time.monotonic() > deadline:
+                self._read_pos = pos
+                return None
+    
+    def _notify_speech_start(self):
+        """Internal method to run the speech start callback, if any."""
+        if self.speech_start_callback is None:
+            return
+        try:
+            self.speech_start_callback()
+        except Exception as e:
+            print(f"Error in speech start callback: {e}")
+    
+    def _audio_from_ring(self, start: int, end: int) -> sr.AudioData:
+        """Build recognizer audio from a span of the ring buffer."""
+        while True:
+            # If the start of a long utterance was overwritten, keep what is left
+            start = min(max(start, self._ring.oldest_position), end)
+            try:
+                raw = self._ring.read(start, end)
+                break
+            except ValueError:
+                if self._ring.oldest_position >= end:
+                    raise
+        return sr.AudioData(raw, self.microphone.SAMPLE_RATE, self.microphone.SAMPLE_WIDTH)
+    
     def listen(self, timeout: int = 10, phrase_time_limit: int = 10) -> Optional[str]:
         """
         Listen for speech input and convert to text.
@@ -34,17 +332,31 @@ class VoiceInput:
             Transcribed text, or None if recognition fails
         """
         try:
-            with self.microphone as source:
+            if self.is_capturing:
                 print("Listening...")
-                audio = self.recognizer.listen(
-                    source, 
-                    timeout=timeout, 
-                    phrase_time_limit=phrase_time_limit
-                )
+                span = self._next_utterance(timeout, phrase_time_limit)
+                if span is None:
+                    raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+                audio = self._audio_from_ring(*span)
+            else:
+                with self.microphone as source:
+                    print("Listening...")
+                    audio = self.recognizer.listen(
+                        source,
+                        timeout=timeout,
+                        phrase_time_limit=phrase_time_limit
+                    )
+                self._notify_speech_start()
             
             print("Processing speech...")
+            self.last_audio = audio
+            start = time.perf_counter()
             # Use Google's speech recognition
-            text = self.recognizer.recognize_google(audio)
+            if self.recognizer_worker is not None:
+                text = self.recognizer_worker.recognize(audio)
+            else:
+                text = self.recognizer.recognize_google(audio)
+            self.last_recognition_seconds = time.perf_counter() - start
             return text
         
         except sr.WaitTimeoutError:
@@ -60,15 +372,38 @@ class VoiceInput:
             print(f"Error during speech recognition: {e}")
             return None
     
-    def listen_continuous(self, callback, timeout: int = 10):
+    def listen_continuous(self, callback, timeout: int = 10, stop_event: Optional[threading.Event] = None):
         """
         Listen continuously and call callback with recognized text.
         
+        Starts continuous capture if it is not already running, so no audio
+        is dropped while the callback is busy.
+        
         Args:
             callback: Function to call with recognized text
             timeout: Timeout for each listening session
+            stop_event: Optional event that ends the loop when set
         """
-        while True:
+        self.start_capture()
+        while self.is_capturing and not (stop_event and stop_event.is_set()):
             text = self.listen(timeout=timeout)
             if text:
                 callback(text)
+    
+    async def utterances(self, timeout: int = 10):
+        """
+        Async iterator over recognized utterances from continuous capture.
+        
+        Example:
+            async for text in voice_input.utterances():
+                ...
+        
+        Args:
+            timeout: Timeout for each listening session
+        """
+        self.start_capture()
+        loop = asyncio.get_running_loop()
+        while self.is_capturing:
+            text = await loop.run_in_executor(None, self.listen, timeout)
+            if text:
+                yield text
@@ -4,30 +4,110 @@ Voice output module for the AI Character Bot.
 Handles text-to-speech to give the AI character a voice.
 """
 
-import pyttsx3
+import os
+import re
+import json
+import time
+import wave
+import shutil
+import tempfile
 import threading
+import subprocess
+import numpy as np
+import pyttsx3
+from abc import ABC, abstractmethod
 from queue import Queue
+from typing import Callable, Iterator, List, Optional, Tuple
 
 
-class VoiceOutput:
-    """Handles text-to-speech output."""
+class TTSBackend(ABC):
+    """
+    Base class for text-to-speech engines.
+    
+    Backends turn text into 16-bit PCM audio and yield it in chunks as it is
+    produced, so playback can start before the whole utterance is ready.
+    """
+    
+    name = "base"
+    sample_rate = 22050
+    sample_width = 2
+    channels = 1
+    
+    # Backends that play through the system themselves set this and
+    # implement speak(text) instead of yielding audio
+    plays_audio = False
     
     def __init__(self, rate: int = 150, volume: float = 0.9):
         """
-        Initialize the voice output system.
+        Initialize the backend.
         
         Args:
             rate: Speech rate in words per minute
             volume: Volume level (0.0 to 1.0)
         """
+        self.rate = rate
+        self.volume = volume
+    
+    @abstractmethod
+    def synthesize(self, text: str) -> Iterator[bytes]:
+        """Yield PCM audio chunks for the given text."""
+    
+    def stop(self):
+        """Abort any synthesis in progress."""
+    
+    def set_rate(self, rate: int):
+        """Set speech rate in words per minute."""
+        self.rate = rate
+    
+    def set_volume(self, volume: float):
+        """Set volume (0.0 to 1.0)."""
+        self.volume = volume
+    
+    def list_voices(self):
+        """Print available voices."""
+        print(f"The {self.name} backend does not support voice selection")
+    
+    def set_voice(self, voice_id: str):
+        """Set voice by ID."""
+        print(f"The {self.name} backend does not support voice selection")
+    
+    def _scale_volume(self, chunk: bytes) -> bytes:
+        """Apply the volume setting to a chunk of 16-bit PCM audio."""
+        if self.volume >= 1.0:
+            return chunk
+        samples = np.frombuffer(chunk, dtype=np.int16)
+        return (samples * self.volume).astype(np.int16).tobytes()
+
+
+class Pyttsx3Backend(TTSBackend):
+    """
+    Offline TTS using the system speech engine through pyttsx3.
+    
+    By default the engine speaks directly, which starts playback at once.
+    With `render_to_file` the utterance is rendered to a WAV file first and
+    streamed to the sink, which is slower to start but lets the audio be
+    captured like any other backend's.
+    """
+    
+    name = "pyttsx3"
+    
+    def __init__(self, rate: int = 150, volume: float = 0.9, render_to_file: bool = False, chunk_frames: int = 2048):
+        """
+        Initialize the pyttsx3 engine.
+        
+        Args:
+            rate: Speech rate in words per minute
+            volume: Volume level (0.0 to 1.0)
+            render_to_file: Render to a WAV file and stream it instead of speaking directly
+            chunk_frames: Audio frames per yielded chunk
+        """
+        super().__init__(rate, volume)
+        self.render_to_file = render_to_file
+        self.chunk_frames = chunk_frames
         self.engine = pyttsx3.init()
         self.engine.setProperty('rate', rate)
         self.engine.setProperty('volume', volume)
         
-        # Use a queue for thread-safe speaking
-        self.speech_queue = Queue()
-        self.is_speaking = False
-        
         # Get available voices
         voices = self.engine.getProperty('voices')
         if voices:
@@ -37,43 +117,68 @@ class VoiceOutput:
                     self.engine.setProperty('voice', voice.id)
                     break
     
-    def speak(self, text: str, blocking: bool = False):
+    @property
+    def plays_audio(self) -> bool:
+        """Whether the engine speaks directly rather than yielding audio."""
+        return not self.render_to_file
+    
+    def speak(self, text: str) -> Tuple[float, float]:
         """
-        Speak the given text.
+        Speak text through the system engine.
         
-        Args:
-            text: Text to speak
-            blocking: If True, wait for speech to complete before returning
+        Returns:
+            Seconds until speech started and seconds of speech
         """
-        if blocking:
+        start = time.perf_counter()
+        started = []
+        token = self.engine.connect('started-utterance', lambda name: started.append(time.perf_counter()))
+        try:
             self.engine.say(text)
             self.engine.runAndWait()
-        else:
-            # Speak in a separate thread to avoid blocking
-            thread = threading.Thread(target=self._speak_thread, args=(text,))
-            thread.daemon = True
-            thread.start()
+        finally:
+            self.engine.disconnect(token)
+        speech_start = started[0] if started else start
+        return speech_start - start, time.perf_counter() - speech_start
     
-    def _speak_thread(self, text: str):
-        """Internal method to speak in a separate thread."""
-        self.is_speaking = True
+    def synthesize(self, text: str) -> Iterator[bytes]:
+        """Yield PCM audio chunks for the given text."""
+        # pyttsx3 has no buffer access, so render the utterance to a file first
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
         try:
-            self.engine.say(text)
+            self.engine.save_to_file(text, path)
             self.engine.runAndWait()
+            with open(path, 'rb') as f:
+                is_wav = f.read(4) == b"RIFF"
+            if not is_wav:
+                # Some drivers (e.g. nsss on macOS) write AIFF whatever the extension
+                print("pyttsx3 did not render WAV audio; speaking directly instead")
+                self.render_to_file = False
+                return
+            with wave.open(path, 'rb') as wav:
+                self.sample_rate = wav.getframerate()
+                self.sample_width = wav.getsampwidth()
+                self.channels = wav.getnchannels()
+                while True:
+                    chunk = wav.readframes(self.chunk_frames)
+                    if not chunk:
+                        break
+                    yield chunk
         finally:
-            self.is_speaking = False
+            os.remove(path)
     
     def stop(self):
-        """Stop current speech."""
-        if self.is_speaking:
-            self.engine.stop()
+        """Abort any synthesis in progress."""
+        self.engine.stop()
     
     def set_rate(self, rate: int):
         """Set speech rate in words per minute."""
+        super().set_rate(rate)
         self.engine.setProperty('rate', rate)
     
     def set_volume(self, volume: float):
         """Set volume (0.0 to 1.0)."""
+        super().set_volume(volume)
         self.engine.setProperty('volume', volume)
     
     def list_voices(self):
@@ -86,3 +191,480 @@ class VoiceOutput:
     def set_voice(self, voice_id: str):
         """Set voice by ID."""
         self.engine.setProperty('voice', voice_id)
+
+
+class PiperBackend(TTSBackend):
+    """Local neural TTS using the Piper command line tool."""
+    
+    name = "piper"
+    
+    # Piper voices are trained at roughly this many words per minute
+    NATURAL_RATE = 150
+    
+    def __init__(
+        self,
+        model_path: str,
+        rate: int = 150,
+        volume: float = 0.9,
+        executable: str = "piper",
+        chunk_bytes: int = 4096
+    ):
+        """
+        Initialize the Piper backend.
+        
+        Args:
+            model_path: Path to the Piper .onnx voice model
+            rate: Speech rate in words per minute
+            volume: Volume level (0.0 to 1.0)
+            executable: Piper executable name or path
+            chunk_bytes: Bytes per yielded chunk
+        """
+        super().__init__(rate, volume)
+        if not model_path or not os.path.isfile(model_path):
+            raise FileNotFoundError(
+                f"Piper voice model not found: '{model_path}'. Set PIPER_MODEL to a downloaded .onnx voice"
+            )
+        self.executable = shutil.which(executable)
+        if self.executable is None:
+            raise FileNotFoundError(
+                f"Piper executable '{executable}' not found. Install Piper or set PIPER_EXECUTABLE"
+            )
+        self.model_path = model_path
+        self.chunk_bytes = chunk_bytes
+        self._process: Optional[subprocess.Popen] = None
+        self._stopped = False
+        
+        # The voice config next to the model holds its sample rate
+        config_path = model_path + ".json"
+        if os.path.exists(config_path):
+            with open(config_path) as f:
+                self.sample_rate = json.load(f).get("audio", {}).get("sample_rate", self.sample_rate)
+    
+    def synthesize(self, text: str) -> Iterator[bytes]:
+        """Yield PCM audio chunks for the given text."""
+        length_scale = self.NATURAL_RATE / max(self.rate, 1)
+        # A file rather than a pipe, so a chatty Piper can't block on stderr
+        errors = tempfile.TemporaryFile()
+        self._stopped = False
+        self._process = subprocess.Popen(
+            [self.executable, "--model", self.model_path, "--output-raw",
+             "--length_scale", f"{length_scale:.3f}"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=errors
+        )
+        process = self._process
+        try:
+            process.stdin.write(text.replace("\n", " ").encode("utf-8") + b"\n")
+            process.stdin.close()
+            while True:
+                chunk = process.stdout.read(self.chunk_bytes)
+                if not chunk:
+                    break
+                # Keep chunks aligned to whole samples
+                if len(chunk) % self.sample_width:
+                    chunk += process.stdout.read(self.sample_width - len(chunk) % self.sample_width)
+                yield self._scale_volume(chunk)
+            
+            process.wait()
+            if process.returncode != 0 and not self._stopped:
+                errors.seek(0)
+                lines = errors.read().decode("utf-8", "replace").strip().splitlines()
+                raise RuntimeError(f"Piper exited with code {process.returncode}: {lines[-1] if lines else 'no error output'}")
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            errors.close()
+            self._process = None
+    
+    def stop(self):
+        """Abort any synthesis in progress."""
+        if self._process is not None and self._process.poll() is None:
+            self._stopped = True
+            self._process.kill()
+
+
+class NullBackend(TTSBackend):
+    """Produces silence lasting as long as the text would take to speak, for testing."""
+    
+    name = "null"
+    
+    def __init__(self, rate: int = 150, volume: float = 0.9, chunk_frames: int = 2048):
+        """
+        Initialize the null backend.
+        
+        Args:
+            rate: Speech rate in words per minute
+            volume: Volume level (0.0 to 1.0)
+            chunk_frames: Audio frames per yielded chunk
+        """
+        super().__init__(rate, volume)
+        self.chunk_frames = chunk_frames
+    
+    def synthesize(self, text: str) -> Iterator[bytes]:
+        """Yield PCM audio chunks for the given text."""
+        seconds = len(text.split()) * 60.0 / max(self.rate, 1)
+        remaining = int(seconds * self.sample_rate)
+        while remaining > 0:
+            frames = min(self.chunk_frames, remaining)
+            remaining -= frames
+            yield bytes(frames * self.sample_width * self.channels)
+
+
+class AudioSink(ABC):
+    """Base class for destinations of synthesized audio."""
+    
+    def open(self, sample_rate: int, sample_width: int, channels: int):
+        """Prepare to receive audio in the given format."""
+    
+    @abstractmethod
+    def write(self, chunk: bytes):
+        """Play or store a chunk of audio."""
+    
+    def close(self):
+        """Release any resources held by the sink."""
+
+
+class PyAudioSink(AudioSink):
+    """Plays audio through a single, long-lived PyAudio output stream."""
+    
+    def __init__(self):
+        """Initialize PyAudio."""
+        import pyaudio
+        self._pyaudio = pyaudio
+        self._audio = pyaudio.PyAudio()
+        self._stream = None
+        self._format = None
+    
+    def open(self, sample_rate: int, sample_width: int, channels: int):
+        """Prepare to receive audio in the given format."""
+        audio_format = (sample_rate, sample_width, channels)
+        if self._stream is not None and self._format == audio_format:
+            return
+        self.close()
+        self._stream = self._audio.open(
+            format=self._audio.get_format_from_width(sample_width),
+            channels=channels,
+            rate=sample_rate,
+            output=True
+        )
+        self._format = audio_format
+    
+    def write(self, chunk: bytes):
+        """Play a chunk of audio."""
+        self._stream.write(chunk)
+    
+    def close(self):
+        """Close the output stream."""
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+    
+    def __del__(self):
+        """Clean up resources."""
+        self.close()
+        if hasattr(self, '_audio'):
+            self._audio.terminate()
+
+
+class NullSink(AudioSink):
+    """Discards audio, keeping only a running total, for testing."""
+    
+    def __init__(self):
+        """Initialize the sink."""
+        self.bytes_written = 0
+    
+    def write(self, chunk: bytes):
+        """Discard a chunk of audio."""
+        self.bytes_written += len(chunk)
+
+
+class WavFileSink(AudioSink):
+    """Writes audio to a WAV file, for testing."""
+    
+    def __init__(self, path: str):
+        """
+        Initialize the sink.
+        
+        Args:
+            path: WAV file to write
+        """
+        self.path = path
+        self._wav = None
+    
+    def open(self, sample_rate: int, sample_width: int, channels: int):
+        """Prepare to receive audio in the given format."""
+        if self._wav is None:
+            self._wav = wave.open(self.path, 'wb')
+            self._wav.setframerate(sample_rate)
+            self._wav.setsampwidth(sample_width)
+            self._wav.setnchannels(channels)
+    
+    def write(self, chunk: bytes):
+        """Append a chunk of audio to the file."""
+        self._wav.writeframes(chunk)
+    
+    def close(self):
+        """Finish the WAV file."""
+        if self._wav is not None:
+            self._wav.close()
+            self._wav = None
+
+
+def create_backend(name: str = "pyttsx3", rate: int = 150, volume: float = 0.9, **kwargs) -> TTSBackend:
+    """
+    Create a TTS backend by name.
+    
+    Args:
+        name: One of "pyttsx3", "piper" or "null"
+        rate: Speech rate in words per minute
+        volume: Volume level (0.0 to 1.0)
+        **kwargs: Backend-specific options (e.g. model_path for Piper)
+    
+    Returns:
+        The configured backend
+    """
+    backends = {
+        'pyttsx3': Pyttsx3Backend,
+        'piper': PiperBackend,
+        'null': NullBackend
+    }
+    if name not in backends:
+        raise ValueError(f"Unknown TTS backend '{name}'. Choose from: {', '.join(backends)}")
+    return backends[name](rate=rate, volume=volume, **kwargs)
+
+
+class SpeakingBudget:
+    """
+    Limits how long a single answer takes to speak.
+    
+    The time budget is converted to a word count using the speech rate, and
+    the seconds-per-word estimate is calibrated from how long utterances
+    actually took to speak.
+    """
+    
+    # Average tokens per English word
+    TOKENS_PER_WORD = 1.33
+    
+    # Extra room given to the model beyond the budget; the overflow becomes
+    # the "continue?" follow-up instead of being cut off mid-sentence
+    TOKEN_HEADROOM = 1.5
+    
+    # Sentence ends are punctuation followed by a space and a capital or digit
+    SENTENCE_END = re.compile(r'(?<=[.!?])\s+(?=["\'(]?[A-Z0-9])')
+    
+    # Words whose trailing period does not end a sentence
+    ABBREVIATIONS = {
+        "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc",
+        "e.g", "i.e", "approx", "fig", "vol", "inc", "ltd"
+    }
+    
+    # Shorter pieces are treated as fragments rather than sentences to cut at
+    MIN_SENTENCE_WORDS = 3
+    
+    def __init__(self, max_seconds: float = 15.0, rate: int = 150):
+        """
+        Initialize the budget.
+        
+        Args:
+            max_seconds: Maximum speaking time per answer
+            rate: Speech rate in words per minute
+        """
+        self.max_seconds = max_seconds
+        self.seconds_per_word = 60.0 / rate
+        # Spoken duration of each utterance, for calibration and reporting
+        self.turn_seconds: List[float] = []
+    
+    @property
+    def max_words(self) -> int:
+        """Words that fit in the budget at the calibrated rate."""
+        return max(1, int(self.max_seconds / self.seconds_per_word))
+    
+    @property
+    def max_tokens(self) -> int:
+        """Response token limit to request from the model."""
+        return int(self.max_words * self.TOKENS_PER_WORD * self.TOKEN_HEADROOM) + 1
+    
+    def sentences(self, text: str) -> List[str]:
+        """Split text into sentences, keeping abbreviations and initials inside them."""
+        sentences: List[str] = []
+        for piece in self.SENTENCE_END.split(text.strip()):
+            last_word = sentences[-1].split()[-1] if sentences else ""
+            # "Dr." and "J." end in a period without ending the sentence
+            if last_word.endswith('.') and (
+                last_word[:-1].lower() in self.ABBREVIATIONS or (len(last_word) == 2 and last_word[0].isupper() and last_word != "I.")
+            ):
+                sentences[-1] += " " + piece
+            else:
+                sentences.append(piece)
+        return sentences
+    
+    def complete_sentences(self, text: str) -> str:
+        """Drop a trailing unfinished sentence, e.g. from a response cut off by max_tokens."""
+        sentences = self.sentences(text)
+        if len(sentences) < 2 or sentences[-1].rstrip().endswith(('.', '!', '?')):
+            return text.strip()
+        kept = sentences[:-1]
+        # A lone fragment says less than the cut-off text it would replace
+        if len(kept) == 1 and len(kept[0].split()) < self.MIN_SENTENCE_WORDS:
+            return text.strip()
+        return " ".join(kept)
+    
+    def split(self, text: str) -> Tuple[str, str]:
+        """
+        Split text at a sentence boundary so the first part fits the budget.
+        
+        Returns:
+            The part to speak now and the remainder (empty if it all fits)
+        """
+        sentences = self.sentences(text)
+        words = 0
+        for idx, sentence in enumerate(sentences):
+            count = len(sentence.split())
+            # Always speak at least one sentence, and never just a fragment
+            if words + count > self.max_words and words >= self.MIN_SENTENCE_WORDS:
+                return " ".join(sentences[:idx]), " ".join(sentences[idx:])
+            words += count
+        return text.strip(), ""
+    
+    def record(self, text: str, seconds: float):
+        """Record how long some text took to speak and update the calibration."""
+        words = len(text.split())
+        if words == 0 or seconds <= 0:
+            return
+        self.turn_seconds.append(seconds)
+        # Exponential moving average so one odd utterance doesn't dominate
+        self.seconds_per_word = 0.7 * self.seconds_per_word + 0.3 * (seconds / words)
+
+
+class VoiceOutput:
+    """Handles text-to-speech output."""
+    
+    def __init__(
+        self,
+        rate: int = 150,
+        volume: float = 0.9,
+        backend: Optional[TTSBackend] = None,
+        sink: Optional[AudioSink] = None
+    ):
+        """
+        Initialize the voice output system.
+        
+        Args:
+            rate: Speech rate in words per minute
+            volume: Volume level (0.0 to 1.0)
+            backend: TTS backend to use (defaults to pyttsx3)
+            sink: Where streamed audio is played (defaults to the speakers,
+                opened on first use, or to nowhere for the null backend)
+        """
+        self.backend = backend or Pyttsx3Backend(rate=rate, volume=volume)
+        if sink is None and isinstance(self.backend, NullBackend):
+            # Silent testing should not need, or wait on, an audio device
+            sink = NullSink()
+        self.sink = sink
+        
+        # Use a queue for thread-safe speaking
+        self.speech_queue = Queue()
+        self.is_speaking = False
+        self._speak_lock = threading.Lock()
+        self._stop_requested = threading.Event()
+        
+        # Timings from the last utterance
+        self.last_time_to_first_audio = 0.0
+        self.last_audio_seconds = 0.0
+        
+        # Called with the text and its spoken duration after each utterance
+        self.speech_finished_callback: Optional[Callable[[str, float], None]] = None
+    
+    def speak(self, text: str, blocking: bool = False, callback: Optional[Callable[[float, float], None]] = None):
+        """
+        Speak the given text.
+        
+        Args:
+            text: Text to speak
+            blocking: If True, wait for speech to complete before returning
+            callback: Optional function called with the time to first audio
+                and the seconds of audio once this text is done, even if stopped
+        """
+        if blocking:
+            self._speak_thread(text, callback)
+        else:
+            # Speak in a separate thread to avoid blocking
+            thread = threading.Thread(target=self._speak_thread, args=(text, callback))
+            thread.daemon = True
+            thread.start()
+    
+    def _speak_thread(self, text: str, callback: Optional[Callable[[float, float], None]] = None):
+        """Internal method to stream audio from the backend into the sink."""
+        with self._speak_lock:
+            self.is_speaking = True
+            self._stop_requested.clear()
+            start = time.perf_counter()
+            first_audio = None
+            audio_seconds = 0.0
+            try:
+                if not self.backend.plays_audio:
+                    if self.sink is None:
+                        self.sink = PyAudioSink()
+                    for chunk in self.backend.synthesize(text):
+                        if self._stop_requested.is_set():
+                            break
+                        if first_audio is None:
+                            first_audio = time.perf_counter() - start
+                            self.sink.open(self.backend.sample_rate, self.backend.sample_width, self.backend.channels)
+                        self.sink.write(chunk)
+                        audio_seconds += len(chunk) / (
+                            self.backend.sample_width * self.backend.channels * self.backend.sample_rate
+                        )
+                
+                # Checked again because a backend can fall back to playing
+                # audio itself, e.g. pyttsx3 when it cannot render WAV
+                if self.backend.plays_audio and first_audio is None and not self._stop_requested.is_set():
+                    offset = time.perf_counter() - start
+                    first_audio, audio_seconds = self.backend.speak(text)
+                    first_audio += offset
+            except Exception as e:
+                print(f"Error during speech output: {e}")
+            finally:
+                self.is_speaking = False
+            
+            first_audio = first_audio or 0.0
+            self.last_time_to_first_audio = first_audio
+            self.last_audio_seconds = audio_seconds
+            
+            if self.speech_finished_callback is not None and not self._stop_requested.is_set():
+                try:
+                    self.speech_finished_callback(text, self.last_audio_seconds)
+                except Exception as e:
+                    print(f"Error in speech finished callback: {e}")
+        
+        # Outside the lock, so slow callbacks don't hold up the next utterance
+        if callback is not None:
+            try:
+                callback(first_audio, audio_seconds)
+            except Exception as e:
+                print(f"Error in speech callback: {e}")
+    
+    def stop(self):
+        """Stop current speech."""
+        if self.is_speaking:
+            self._stop_requested.set()
+            self.backend.stop()
+    
+    def set_rate(self, rate: int):
+        """Set speech rate in words per minute."""
+        self.backend.set_rate(rate)
+    
+    def set_volume(self, volume: float):
+        """Set volume (0.0 to 1.0)."""
+        self.backend.set_volume(volume)
+    
+    def list_voices(self):
+        """Print available voices."""
+        self.backend.list_voices()
+    
+    def set_voice(self, voice_id: str):
+        """Set voice by ID."""
+        self.backend.set_voice(voice_id)
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Worker process module for the AI Character Bot.
+Runs screen encoding and speech recognition in separate processes so they do
+not compete with audio playback and the API client for the GIL.
+"""
+
+import queue
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from PIL import Image
+
+from screen_capture import PendingCapture, ScreenCapture
+
+
+class SharedMemoryWorker:
+    """
+    Runs a task loop in a child process.
+    
+    Control messages travel over small queues, while bulk data (audio, encoded
+    frames, transcripts) is exchanged through one shared memory buffer. Calls
+    are serialized, so the buffer is used by one request at a time.
+    """
+    
+    def __init__(self, target, buffer_size: int, args: tuple = ()):
+        """
+        Start the worker process.
+        
+        Args:
+            target: Top-level function run in the child as
+                target(shm_name, requests, responses, *args)
+            buffer_size: Size of the shared memory buffer in bytes
+            args: Extra picklable arguments for the target
+        """
+        # Spawn gives the same behaviour on every platform and avoids forking
+        # the audio and HTTP threads of the parent
+        self._context = multiprocessing.get_context("spawn")
+        self._target = target
+        self._args = args
+        self._shm = shared_memory.SharedMemory(create=True, size=buffer_size)
+        self._lock = threading.Lock()
+        self._start()
+    
+    def _start(self):
+        """Internal method to launch the child process."""
+        self._requests = self._context.Queue()
+        self._responses = self._context.Queue()
+        self._process = self._context.Process(
+            target=self._target,
+            args=(self._shm.name, self._requests, self._responses) + self._args,
+            daemon=True
+        )
+        self._process.start()
+    
+    def call(self, message: dict, payload: bytes = b"", timeout: Optional[float] = 30) -> Tuple[dict, bytes]:
+        """
+        Send a request to the worker and wait for its reply.
+        
+        Args:
+            message: Control message for the worker
+            payload: Bulk data placed in shared memory
+            timeout: Seconds to wait for the reply
+        
+        Returns:
+            The reply message and the bulk data it returned
+        """
+        if len(payload) > self._shm.size:
+            raise ValueError(f"Payload of {len(payload)} bytes does not fit in the worker buffer")
+        
+        with self._lock:
+            self._shm.buf[:len(payload)] = payload
+            self._requests.put((message, len(payload)))
+            try:
+                reply, length = self._responses.get(timeout=timeout)
+            except queue.Empty:
+                # The child may still write into the buffer, so replace it
+                self._process.terminate()
+                self._process.join()
+                self._start()
+                raise TimeoutError("Worker process did not respond in time")
+            return reply, bytes(self._shm.buf[:length])
+    
+    def close(self):
+        """Stop the worker process and free the shared memory."""
+        if self._process.is_alive():
+            self._requests.put(None)
+            self._process.join(timeout=2)
+            if self._process.is_alive():
+                self._process.terminate()
+        self._shm.close()
+        self._shm.unlink()
+
+
+def _serve(shm_name: str, requests, responses, handle):
+    """
+    Request loop run in the child process.
+    
+    `handle(message, payload)` returns a reply message and result bytes, which
+    are copied into shared memory for the parent.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        while True:
+            item = requests.get()
+            if item is None:
+                break
+            message, length = item
+            try:
+                reply, result = handle(message, bytes(shm.buf[:length]))
+                if len(result) > shm.size:
+                    reply, result = {"error": "Result does not fit in the worker buffer"}, b""
+            except Exception as e:
+                reply, result = {"error": str(e)}, b""
+            shm.buf[:len(result)] = result
+            responses.put((reply, len(result)))
+    finally:
+        shm.close()
+
+
+def _screen_worker_main(shm_name: str, requests, responses, screen_class=None):
+    """Entry point of the screen capture worker process."""
+    screen = (screen_class or ScreenCapture)()
+    
+    def handle(message, payload):
+        if message["op"] == "monitor_count":
+            return {"monitor_count": screen.get_monitor_count()}, b""
+        if message["op"] == "last_frame":
+            img = screen.get_last_frame()
+            if img is None:
+                return {"error": "No frame captured yet"}, b""
+            return {"mode": img.mode, "size": list(img.size)}, img.tobytes()
+        if message["op"] == "grab":
+            img = screen.capture_screen(message["monitor_number"])
+            if img is None:
+                return {"error": "Screen capture failed"}, b""
+            return {"mode": img.mode, "size": list(img.size)}, img.tobytes()
+        data = screen.capture_as_base64(message["monitor_number"], tuple(message["max_size"]))
+        if data is None:
+            return {"error": "Screen capture failed"}, b""
+        return {}, data.encode("ascii")
+    
+    _serve(shm_name, requests, responses, handle)
+
+
+def _recognizer_worker_main(shm_name: str, requests, responses, recognizer_class=None):
+    """Entry point of the speech recognition worker process."""
+    import speech_recognition as sr
+    
+    recognizer = (recognizer_class or sr.Recognizer)()
+    
+    def handle(message, payload):
+        audio = sr.AudioData(payload, message["sample_rate"], message["sample_width"])
+        try:
+            return {}, recognizer.recognize_google(audio).encode("utf-8")
+        except sr.UnknownValueError:
+            return {"error": "unknown_value"}, b""
+        except sr.RequestError as e:
+            return {"error": "request", "message": str(e)}, b""
+    
+    _serve(shm_name, requests, responses, handle)
+
+
+class IsolatedScreenCapture:
+    """
+    Drop-in replacement for ScreenCapture that captures and encodes in a worker process.
+    
+    `capture_screen` copies the raw frame back to this process, and
+    `encode_base64` runs here; use `capture_as_base64` to keep the work in the worker.
+    """
+    
+    # Encoding a frame that is already in this process happens here
+    encode_base64 = staticmethod(ScreenCapture.encode_base64)
+    
+    def __init__(self, buffer_size: int = 48 * 1024 * 1024, screen_class: Optional[type] = None):
+        """
+        Start the screen capture worker.
+        
+        Args:
+            buffer_size: Largest raw frame or encoded image the worker can
+                return, in bytes (the default fits a 5K RGB frame)
+            screen_class: ScreenCapture class to run in the worker (must be
+                importable by the child process)
+        """
+        self._worker = SharedMemoryWorker(_screen_worker_main, buffer_size, (screen_class,))
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    def capture_screen(self, monitor_number: int = 1) -> Optional[Image.Image]:
+        """
+        Capture a screenshot of the specified monitor.
+        
+        Args:
+            monitor_number: Monitor index (1 for primary, 2+ for additional monitors)
+        
+        Returns:
+            PIL Image object of the screenshot, or None if capture fails
+        """
+        return self._frame_call({"op": "grab", "monitor_number": monitor_number})
+    
+    def _frame_call(self, message: dict) -> Optional[Image.Image]:
+        """Internal method to fetch a raw frame from the worker."""
+        try:
+            reply, data = self._worker.call(message)
+        except Exception as e:
+            print(f"Error capturing screen: {e}")
+            return None
+        if "error" in reply:
+            print(f"Error capturing screen: {reply['error']}")
+            return None
+        return Image.frombytes(reply["mode"], tuple(reply["size"]), data)
+    
+    def capture_as_base64(self, monitor_number: int = 1, max_size: tuple = (1024, 768)) -> Optional[str]:
+        """
+        Capture screen and convert to base64 string for API transmission.
+        
+        Args:
+            monitor_number: Monitor index
+            max_size: Maximum dimensions to resize to (width, height)
+        
+        Returns:
+            Base64 encoded string of the image, or None if capture fails
+        """
+        try:
+            reply, data = self._worker.call({
+                "op": "capture",
+                "monitor_number": monitor_number,
+                "max_size": list(max_size)
+            })
+        except Exception as e:
+            print(f"Error capturing screen: {e}")
+            return None
+        if "error" in reply:
+            print(f"Error capturing screen: {reply['error']}")
+            return None
+        return data.decode("ascii")
+    
+    def capture_async(self, monitor_number: int = 1, max_size: tuple = (1024, 768)) -> PendingCapture:
+        """
+        Start capturing and encoding the screen without waiting for it.
+        
+        Returns:
+            PendingCapture whose result is the base64 screenshot
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="screen-capture")
+        return PendingCapture(self._executor, self.capture_as_base64, monitor_number, max_size)
+    
+    def get_monitor_count(self) -> int:
+        """Get the number of available monitors."""
+        reply, _ = self._worker.call({"op": "monitor_count"})
+        return reply.get("monitor_count", 0)
+    
+    def get_last_frame(self) -> Optional[Image.Image]:
+        """Get the full-resolution frame from the most recent capture, copied from the worker."""
+        return self._frame_call({"op": "last_frame"})
+    
+    def close(self):
+        """Stop the worker process."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._worker.close()
+
+
+class RecognizerWorker:
+    """Runs Google speech recognition in a worker process."""
+    
+    def __init__(self, buffer_size: int = 4 * 1024 * 1024, recognizer_class: Optional[type] = None):
+        """
+        Start the recognition worker.
+        
+        Args:
+            buffer_size: Largest utterance the worker can accept, in bytes
+            recognizer_class: speech_recognition Recognizer class to run in the
+                worker (must be importable by the child process)
+        """
+        self._worker = SharedMemoryWorker(_recognizer_worker_main, buffer_size, (recognizer_class,))
+    
+    def recognize(self, audio) -> str:
+        """
+        Transcribe audio in the worker process.
+        
+        Raises the same speech_recognition errors as `recognize_google`.
+        
+        Args:
+            audio: speech_recognition AudioData
+        
+        Returns:
+            Transcribed text
+        """
+        import speech_recognition as sr
+        
+        reply, data = self._worker.call(
+            {"sample_rate": audio.sample_rate, "sample_width": audio.sample_width},
+            audio.frame_data
+        )
+        if reply.get("error") == "unknown_value":
+            raise sr.UnknownValueError()
+        if reply.get("error") == "request":
+            raise sr.RequestError(reply["message"])
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        return data.decode("utf-8")
+    
+    def close(self):
+        """Stop the worker process."""
+        self._worker.close()